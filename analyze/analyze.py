@@ -1,13 +1,177 @@
+import cache
 import concurrent.futures
+import hashlib
 import sys
 import shutil
 import plots
+import scheduler
 import utils
 import os
 import subprocess
 import json
 import numpy as np
 
+# Bump when analyze_simulation changes, so cached analyses are recomputed
+ANALYSIS_VERSION = 4
+
+
+# Accumulators of every event metric of a simulation, filled in a single pass
+# over its events
+def get_event_accumulators(
+    particle_mass, domain_radius, obstacle_radius, t_max, time_slot_duration
+):
+    return {
+        "wall_collision_frequency": utils.CollisionFrequencyAccumulator(
+            utils.WALL_EVENT
+        ),
+        "obstacle_collision_frequency": utils.CollisionFrequencyAccumulator(
+            utils.OBSTACLE_EVENT
+        ),
+        "collision_count": utils.CollisionCountAccumulator(utils.OBSTACLE_EVENT),
+        "first_collision_count": utils.FirstCollisionCountAccumulator(
+            utils.OBSTACLE_EVENT
+        ),
+        "obstacle_pressures": utils.SlotPressureAccumulator(
+            utils.OBSTACLE_EVENT,
+            obstacle_radius,
+            time_slot_duration,
+            particle_mass,
+            t_max,
+        ),
+        "wall_pressures": utils.SlotPressureAccumulator(
+            utils.WALL_EVENT,
+            domain_radius,
+            time_slot_duration,
+            particle_mass,
+            t_max,
+        ),
+        "last_velocities": utils.LastVelocityAccumulator(),
+    }
+
+
+# Result of a simulation from its static data, snapshots and event metrics,
+# name identifies it in the messages
+def summarize_simulation(name, parameters, snapshots, metrics):
+    if metrics["obstacle_collision_frequency"] > 0:
+        ratio = (
+            metrics["wall_collision_frequency"]
+            / metrics["obstacle_collision_frequency"]
+        )
+        print(f"Wall collision frequency / Obstacle collision frequency: {ratio}")
+
+    collision_times, collision_counts = metrics["collision_count"]
+    first_collision_times, first_collision_counts = metrics["first_collision_count"]
+    obstacle_pressures = metrics["obstacle_pressures"]
+    wall_pressures = metrics["wall_pressures"]
+
+    # The sweep only writes the first snapshot, so the energy is also checked
+    # at t_max with the velocities after the last events
+    final_snapshot = utils.apply_last_velocities(
+        snapshots[0], metrics["last_velocities"]
+    )
+    diagnostics = utils.get_energy_diagnostics(
+        np.concatenate([snapshots, final_snapshot[np.newaxis]]),
+        parameters["particle_mass"],
+        parameters.get("obstacle_mass"),
+    )
+
+    if not diagnostics["energy_conserved"]:
+        print(
+            f"Warning: kinetic energy drifted {diagnostics['max_energy_drift']:.2e} on {name}"
+        )
+
+    temperature = float(diagnostics["temperatures"][0])
+
+    # 5 digits of precision
+    temperature = round(temperature, 5)
+
+    return {
+        "parameters": parameters,
+        "collision_count": {
+            "times": collision_times.tolist(),
+            "counts": collision_counts.tolist(),
+        },
+        "first_collision_count": {
+            "times": first_collision_times.tolist(),
+            "counts": first_collision_counts.tolist(),
+        },
+        "temperature": temperature,
+        "max_energy_drift": diagnostics["max_energy_drift"],
+        "obstacle_pressures": obstacle_pressures.tolist(),
+        "wall_pressures": wall_pressures.tolist(),
+    }
+
+
+# Parses and analyzes the output of a finished simulation. Runs on the
+# analysis process pool, so it only takes and returns picklable values
+def analyze_simulation(
+    unique_dir,
+    particle_mass,
+    domain_radius,
+    obstacle_radius,
+    t_max,
+    time_slot_duration,
+):
+    print(f"Reading simulation on {unique_dir}")
+    # Parse the static and dynamic files from the simulation
+    static_file = os.path.join(unique_dir, "static.txt")
+
+    # Parse static and dynamic files
+    parameters = utils.load_static_data(static_file)
+    snapshot_times, snapshots = utils.load_simulation_snapshots(
+        unique_dir,
+        parameters["particle_count"],
+        parameters["snapshot_count"],
+    )
+
+    print(f"Analyzing simulation on {unique_dir}")
+
+    # Every event metric comes from a single pass over the events
+    metrics = utils.accumulate_events(
+        utils.iter_simulation_event_blocks(unique_dir),
+        t_max,
+        get_event_accumulators(
+            particle_mass, domain_radius, obstacle_radius, t_max, time_slot_duration
+        ),
+    )
+
+    return summarize_simulation(unique_dir, parameters, snapshots, metrics)
+
+
+# Runs a scheduled simulation with its output streamed into the analysis, so it
+# is analyzed as it runs and nothing is written to disk. It runs on the analysis
+# process pool so the parsing is not serialized by the GIL of the scheduler
+# threads. Returns the summary and the usage of the simulation
+def stream_and_analyze_simulation(
+    job,
+    memory_gigs,
+    particle_mass,
+    domain_radius,
+    obstacle_radius,
+    t_max,
+    time_slot_duration,
+):
+    usage = {}
+    parameters, _, snapshots, metrics = utils.stream_simulation(
+        job,
+        memory_gigs,
+        get_event_accumulators(
+            particle_mass, domain_radius, obstacle_radius, t_max, time_slot_duration
+        ),
+        stream_snapshots=True,
+        usage=usage,
+    )
+
+    name = f"speed {job['speed']}, repetition {job['repetition']}"
+    return summarize_simulation(name, parameters, snapshots, metrics), usage
+
+
+# Seed of a run of the sweep, derived from its speed and repetition so runs at
+# different speeds do not start from the same positions. Fits in a Java long
+def get_run_seed(speed, repetition):
+    digest = hashlib.sha256(f"{float(speed)}/{repetition}".encode()).digest()
+    return int.from_bytes(digest[:8], "big") >> 1
+
 
 def execute_simulations(
     N,
@@ -21,160 +185,199 @@ def execute_simulations(
     time_slot_duration,
     repetitions,
     root_dir="data",
-    is_concurrent=True,
-    max_workers=4,
+    max_workers=None,
+    binary_output=False,
+    analysis_workers=None,
+    cache_size_gigs=cache.DEFAULT_MAX_SIZE_GIGS,
+    stream=False,
+    batch_size=utils.DEFAULT_BATCH_SIZE,
 ):
 
-    available_memory = 12
-    memory_per_simulation = (
-        available_memory if not is_concurrent else int(available_memory / max_workers)
-    )
-
-    def submit_simulation(v, repetition):
-        """Helper function to submit or execute simulation"""
-        return utils.execute_simulation(
-            N,
-            particle_radius,
-            particle_mass,
-            domain_type,
-            domain_radius,
-            obstacle_radius,
-            v,
-            t_max,
-            repetition,
-            memory_per_simulation,
-            os.path.join(root_dir, "simulations"),
+    skip = 100000000
+
+    def submit_simulation(job, memory_gigs, usage):
+        """Helper function to execute a scheduled simulation"""
+        # The scheduler thread only waits for the streamed simulation, which is
+        # read and analyzed on the process pool
+        if stream:
+            result, stream_usage = analysis_executor.submit(
+                stream_and_analyze_simulation,
+                job,
+                memory_gigs,
+                particle_mass,
+                domain_radius,
+                obstacle_radius,
+                t_max,
+                time_slot_duration,
+            ).result()
+            usage.update(stream_usage)
+            return result
+
+        # The JVM of a batch runs one simulation at a time, the scheduler runs
+        # as many batches at once as the CPUs and memory allow
+        return utils.execute_simulation_batch(
+            [
+                {
+                    **run,
+                    "root_dir": os.path.join(root_dir, "simulations"),
+                    "binary_output": binary_output,
+                }
+                for run in job["runs"]
+            ],
+            memory_gigs,
+            threads=1,
+            usage=usage,
         )
 
-    remaining_simulations = len(speeds) * repetitions
-    dirs = []
+    # Every parameter of a run, so they also work as its cache key
+    jobs = [
+        {
+            "N": N,
+            "particle_radius": particle_radius,
+            "particle_mass": particle_mass,
+            "domain_type": domain_type,
+            "domain_radius": domain_radius,
+            "obstacle": "fixed",
+            "obstacle_radius": obstacle_radius,
+            "speed": v,
+            "t_max": t_max,
+            "skip": skip,
+            "seed": get_run_seed(v, repetition),
+            "repetition": repetition,
+        }
+        for v in speeds
+        for repetition in range(repetitions)
+    ]
+
+    cache_dir = os.path.join(root_dir, "cache")
+    analysis_parameters = {
+        "version": ANALYSIS_VERSION,
+        "t_max": t_max,
+        "time_slot_duration": time_slot_duration,
+    }
+
+    # (speed, repetition) -> (job, future of the analysis of that simulation)
+    analysis_futures = {}
+    cached_analyses = set()
+
+    # Each simulation is analyzed on the process pool as soon as it finishes
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=analysis_workers
+    ) as analysis_executor:
+
+        def submit_analysis(job, unique_dir):
+            """Helper function to analyze a finished simulation on the process pool"""
+            analysis_futures[(job["speed"], job["repetition"])] = (
+                job,
+                analysis_executor.submit(
+                    analyze_simulation,
+                    unique_dir,
+                    particle_mass,
+                    domain_radius,
+                    obstacle_radius,
+                    t_max,
+                    time_slot_duration,
+                ),
+            )
 
-    if is_concurrent:
+        # Only the simulations missing from the cache are executed
+        pending_jobs = []
+        for job in jobs:
+            analysis = cache.load_analysis(cache_dir, job, analysis_parameters)
+            if analysis is not None:
+                future = concurrent.futures.Future()
+                future.set_result(analysis)
+                analysis_futures[(job["speed"], job["repetition"])] = (job, future)
+                cached_analyses.add((job["speed"], job["repetition"]))
+                continue
+
+            simulation_dir = cache.get_simulation_dir(cache_dir, job)
+            if simulation_dir is not None:
+                submit_analysis(job, simulation_dir)
+                continue
+
+            pending_jobs.append(job)
+
+        remaining_simulations = len(pending_jobs)
         print(
-            f"Executing {remaining_simulations} simulations concurrently, with {max_workers} workers"
+            f"Found {len(jobs) - remaining_simulations} simulations in the cache, executing {remaining_simulations}"
         )
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = [
-                executor.submit(submit_simulation, v, repetition)
-                for v in speeds
-                for repetition in range(repetitions)
+
+        # Streamed simulations run on their own, the rest batch_size per JVM
+        if stream:
+            scheduled_jobs = pending_jobs
+        else:
+            scheduled_jobs = [
+                {"runs": [pending_jobs[i] for i in batch]}
+                for batch in utils.get_simulation_batches(pending_jobs, batch_size)
             ]
-            # Collect the directories from the futures
-            for future in concurrent.futures.as_completed(futures):
-                try:
-                    dir = future.result()
-                    dirs.append(dir)
-                    remaining_simulations -= 1
-                except Exception as e:
-                    print(f"An error occurred during simulation: {e}")
 
-    else:
-        print(f"Executing {remaining_simulations} simulations")
-        for v in speeds:
-            for repetition in range(repetitions):
-                try:
-                    dir = submit_simulation(v, repetition)
-                    dirs.append(dir)
+        # Streamed simulations keep no output in memory, so their usage is
+        # recorded apart from the batches
+        history_file = os.path.join(
+            root_dir, "scheduler_history_stream.json" if stream else "scheduler_history.json"
+        )
+
+        # Runs as many simulations at once as the CPUs and memory allow
+        for job, future in scheduler.schedule_simulations(
+            scheduled_jobs,
+            submit_simulation,
+            history_file=history_file,
+            max_workers=max_workers,
+        ):
+            try:
+                # A streamed simulation comes back already analyzed
+                if stream:
+                    future.result()
+                    analysis_futures[(job["speed"], job["repetition"])] = (job, future)
                     remaining_simulations -= 1
                     print(
-                        f"Completed simulation on {dir}, {remaining_simulations} remaining"
+                        f"Completed streamed simulation with speed {job['speed']}, repetition {job['repetition']}, {remaining_simulations} remaining"
                     )
-                except Exception as e:
-                    print(f"An error occurred during simulation: {e}")
-
-    results = []
-
-    remaining_simulations = len(dirs)
-    print(f"Processing {remaining_simulations} simulations")
-
-    for unique_dir in dirs:
-        try:
-
-            print(f"Reading simulation on {unique_dir}")
-            # Parse the static and dynamic files from the simulation
-            static_file = os.path.join(unique_dir, "static.txt")
-            snapshots_file = os.path.join(unique_dir, "snapshots.txt")
-            events_file = os.path.join(unique_dir, "events.txt")
-
-            # Parse static and dynamic files
-            parameters = utils.load_static_data(static_file)
-            event_times, events = utils.load_event_data(
-                events_file, parameters["event_count"]
-            )
-            snapshot_times, snapshots = utils.load_snapshot_data(
-                snapshots_file,
-                parameters["particle_count"],
-                parameters["snapshot_count"],
-            )
+                    continue
+
+                # Each run of the batch is cached on its own, the ones that
+                # failed are left out and run again on the next sweep
+                for run, unique_dir in zip(job["runs"], future.result()):
+                    if unique_dir is None:
+                        remaining_simulations -= 1
+                        print(
+                            f"Simulation with speed {run['speed']}, repetition {run['repetition']} failed, {remaining_simulations} remaining"
+                        )
+                        continue
+
+                    dir = cache.store_simulation(cache_dir, run, unique_dir)
+                    submit_analysis(run, dir)
+                    remaining_simulations -= 1
+                    print(f"Completed simulation on {dir}, {remaining_simulations} remaining")
+            except Exception as e:
+                print(f"An error occurred during simulation: {e}")
 
-            obstacle_collision_times = utils.get_collisions_with_obstacle(
-                event_times, events, t_max
-            )
+        results = []
 
-            obstacle_collision_times = list(obstacle_collision_times.keys())
+        remaining_simulations = len(analysis_futures)
+        print(f"Processing {remaining_simulations} simulations")
 
-            wall_collision_times = utils.get_collision_with_wall(
-                event_times, events, t_max
-            )
+        # Sorted by speed and repetition so the results are reproducible
+        for v, repetition in sorted(analysis_futures):
+            try:
+                job, future = analysis_futures[(v, repetition)]
+                result = future.result()
 
-            wall_collision_times = list(wall_collision_times.keys())
+                if (v, repetition) not in cached_analyses:
+                    cache.store_analysis(cache_dir, job, analysis_parameters, result)
 
-            wall_collision_frequency = len(wall_collision_times) / max(
-                wall_collision_times
-            )
-            obstacle_collision_frequency = len(obstacle_collision_times) / max(
-                obstacle_collision_times
-            )
-
-            ratio = wall_collision_frequency / obstacle_collision_frequency
+                results.append(result)
 
-            print(f"Wall collision frequency / Obstacle collision frequency: {ratio}")
+                remaining_simulations -= 1
+                print(
+                    f"Processed simulation with speed {v}, repetition {repetition}, {remaining_simulations} remaining"
+                )
 
-            print(f"Analyzing simulation on {unique_dir}")
-            # TODO: analyze results
-            collision_count = utils.get_collision_with_obstacle_count(
-                event_times, events, t_max
-            )
-            first_collision_count = utils.get_first_collision_with_obstacle_count(
-                event_times, events, t_max
-            )
+            except Exception as e:
+                print(f"An error occurred during processing: {e}")
 
-            obstacle_pressures, wall_pressures = utils.get_system_pressure(
-                event_times,
-                events,
-                domain_radius,
-                obstacle_radius,
-                time_slot_duration,
-                particle_mass,
-                t_max,
-            )
-
-            temperature = utils.get_system_temperature(
-                snapshots, parameters["particle_mass"]
-            )
-
-            # 5 digits of precision
-            temperature = round(temperature, 5)
-
-            # Append the parsed data to results
-            results.append(
-                {
-                    "parameters": parameters,
-                    "collision_count": collision_count,
-                    "first_collision_count": first_collision_count,
-                    "temperature": temperature,
-                    "obstacle_pressures": obstacle_pressures,
-                    "wall_pressures": wall_pressures,
-                }
-            )
-
-            remaining_simulations -= 1
-            print(
-                f"Processed simulation on {unique_dir}, {remaining_simulations} remaining"
-            )
-
-        except Exception as e:
-            print(f"An error occurred during processing: {e}")
+    cache.evict(cache_dir, cache_size_gigs)
 
     # Delete root_dir/simulations
     try:
@@ -216,13 +419,8 @@ def plot_results(results, time_slot_duration, output_dir="data"):
         collision_count = result["collision_count"]
         first_collision_count = result["first_collision_count"]
 
-        # Collision counts is a list of dict [time, count].
         # Calculate the slope of the collision count
-        times = [float(time) for time in collision_count.keys()]
-        counts = list(collision_count.values())
-
-        # Calculate the slope of the collision count
-        slope = np.polyfit(times, counts, 1)[0]
+        slope = np.polyfit(collision_count["times"], collision_count["counts"], 1)[0]
         temperature = result["temperature"]
 
         if temperature not in slopes:
@@ -233,25 +431,30 @@ def plot_results(results, time_slot_duration, output_dir="data"):
             time_to_all_collisions[temperature] = []
 
         time_to_limit = 0
-        for time, count in first_collision_count.items():
-            if count == first_collision_limit:
-                time_to_limit = float(time)
-                break
+        reached_limit = np.flatnonzero(
+            np.asarray(first_collision_count["counts"]) >= first_collision_limit
+        )
+        if len(reached_limit) > 0:
+            time_to_limit = first_collision_count["times"][reached_limit[0]]
 
         if time_to_limit == 0:
             print(f"Could not find time to limit for v={v}")
 
         time_to_all_collisions[temperature].append(time_to_limit)
 
+        # Read once, results may be read from the file on every access
+        run_wall_pressures = result["wall_pressures"]
+        run_obstacle_pressures = result["obstacle_pressures"]
+
         system_pressures = [
             (wall_pressure + obstacle_pressure) / 2
             for wall_pressure, obstacle_pressure in zip(
-                result["wall_pressures"][1:], result["obstacle_pressures"][1:]
+                run_wall_pressures, run_obstacle_pressures
             )
         ]
 
-        wall_pressure = np.mean(result["wall_pressures"])
-        obstacle_pressure = np.mean(result["obstacle_pressures"])
+        wall_pressure = np.mean(run_wall_pressures)
+        obstacle_pressure = np.mean(run_obstacle_pressures)
         print(
             f"Wall mean pressure: {wall_pressure}, Obstacle mean pressure: {obstacle_pressure}, Ratio: {wall_pressure / obstacle_pressure if obstacle_pressure != 0 else 0}"
         )
@@ -276,8 +479,8 @@ def plot_results(results, time_slot_duration, output_dir="data"):
         first_collision_counts_with_obstacle.append(first_collision_count)
         labels.append(f"v={v} (m/s)")
 
-        obstacle_pressures.append(result["obstacle_pressures"])
-        wall_pressures.append(result["wall_pressures"])
+        obstacle_pressures.append(run_obstacle_pressures)
+        wall_pressures.append(run_wall_pressures)
 
     mean_slopes = []
     std_slopes = []
@@ -403,13 +606,45 @@ def plot_results(results, time_slot_duration, output_dir="data"):
     )
 
 
+# Results.json files written before the .npz store had {time: count} collision
+# counts and pressures with an empty leading slot, they are converted to the
+# layout plot_results reads
+def load_legacy_results(results_file):
+    with open(results_file, "r") as json_file:
+        results = json.load(json_file)
+
+    for result in results:
+        if "times" in result["collision_count"]:
+            continue
+
+        for key in ("collision_count", "first_collision_count"):
+            counts = result[key]
+            times = sorted(counts, key=float)
+            result[key] = {
+                "times": [float(time) for time in times],
+                "counts": [counts[time] for time in times],
+            }
+
+        for key in ("obstacle_pressures", "wall_pressures"):
+            result[key] = result[key][1:]
+
+    return results
+
+
 if __name__ == "__main__":
 
     # If arg is generate, generate data
     # If arg is plot, plot data
 
+    # --stream analyzes the simulations as they run, without writing their output
+    stream = "--stream" in sys.argv
+    if stream:
+        sys.argv.remove("--stream")
+
     if len(sys.argv) < 2:
-        print("Usage: python system_behaviour.py <generate|plot> [concurrent_workers] ")
+        print(
+            "Usage: python analyze.py <generate|plot> [concurrent_workers] [analysis_workers] [--stream]"
+        )
         exit(1)
 
     time_slot_duration = 0.01
@@ -431,8 +666,9 @@ if __name__ == "__main__":
 
         repetitions = 10
 
-        is_concurrent = True if len(sys.argv) == 3 else False
-        workers = int(sys.argv[2]) if is_concurrent else 4
+        # Without a worker count the scheduler uses every available CPU
+        workers = int(sys.argv[2]) if len(sys.argv) >= 3 else None
+        analysis_workers = int(sys.argv[3]) if len(sys.argv) == 4 else None
 
         results = execute_simulations(
             N,
@@ -446,22 +682,25 @@ if __name__ == "__main__":
             time_slot_duration,
             repetitions,
             root_dir="data",
-            is_concurrent=is_concurrent,
             max_workers=workers,
+            analysis_workers=analysis_workers,
+            stream=stream,
         )
 
         print("Dumping results")
 
-        # Save as json
-        with open("data/results.json", "w") as json_file:
-            json.dump(results, json_file, indent=4)
+        utils.save_results(results, "data/results.npz")
 
     elif sys.argv[1] == "plot":
-        # Read results from json_file
-        with open("data/results.json", "r") as json_file:
-            results = json.load(json_file)
-
+        # Results from before the .npz store are still read from json
+        if os.path.exists("data/results.npz"):
+            with utils.open_results("data/results.npz") as results:
+                plot_results(results, time_slot_duration, output_dir="data")
+        else:
+            results = load_legacy_results("data/results.json")
             plot_results(results, time_slot_duration, output_dir="data")
 
     else:
-        print("Usage: python analyze.py <generate|plot> [concurrent_workers] ")
+        print(
+            "Usage: python analyze.py <generate|plot> [concurrent_workers] [analysis_workers] [--stream]"
+        )
@@ -1,56 +1,65 @@
+import concurrent.futures
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import EllipseCollection
+import os
+import subprocess
 import sys
 import utils
 
 
-def add_intermediate_positions(time_steps, particle_data, steps_per_interval):
+def get_frame_offsets(time_steps, steps_per_interval):
     """
-    Add intermediate positions between time steps based on custom steps per interval.
+    Interval of every frame but the last one, and its time from the start of that interval.
 
-    :param time_steps: List of original time steps (collisions).
-    :param particle_data: List of particle positions and velocities for each time step.
+    :param time_steps: Array of original time steps (collisions).
     :param steps_per_interval: List of the number of intermediate steps to add for each interval.
-    :return: New time steps and particle data with interpolated values.
+    :return: Interval index and time offset of each frame.
     """
-    new_time_steps = []
-    new_particle_data = []
+    steps_per_interval = np.asarray(steps_per_interval, dtype=np.int64)
 
-    for i in range(len(time_steps) - 1):
-        # Current time step and next time step
-        t0 = time_steps[i]
-        t1 = time_steps[i + 1]
-        delta_t = (t1 - t0) / (steps_per_interval[i] + 1)  # Divide time interval
+    # Every interval contributes its starting snapshot plus its intermediate steps
+    frames_per_interval = steps_per_interval + 1
+    interval = np.repeat(np.arange(len(steps_per_interval)), frames_per_interval)
+    first_frame = np.cumsum(frames_per_interval) - frames_per_interval
+    k = np.arange(len(interval)) - first_frame[interval]
 
-        # Current and next particle positions
-        current_positions = particle_data[i]
-        next_positions = particle_data[i + 1]
+    # Divide each time interval
+    delta_t = np.diff(time_steps) / frames_per_interval
 
-        # Add the current time step and particle positions
-        new_time_steps.append(t0)
-        new_particle_data.append(current_positions)
+    return interval, k * delta_t[interval]
 
-        # Interpolate positions between t0 and t1 using MRU
-        for k in range(1, steps_per_interval[i] + 1):
-            interpolated_time = t0 + k * delta_t
-            interpolated_positions = []
 
-            for j in range(len(current_positions)):
-                x0, y0, vx0, vy0 = current_positions[j]
+def add_intermediate_positions(time_steps, particle_data, steps_per_interval):
+    """
+    Add intermediate positions between time steps based on custom steps per interval.
+
+    :param time_steps: Array of original time steps (collisions).
+    :param particle_data: Array (snapshots, particles, 4) of particle positions and velocities for each time step.
+    :param steps_per_interval: List of the number of intermediate steps to add for each interval.
+    :return: New time steps and a (frames, particles, 4) array with interpolated values.
+    """
+    time_steps = np.asarray(time_steps, dtype=np.float64)
+    particle_data = np.asarray(particle_data, dtype=np.float64)
 
-                # Use MRU for x and y
-                x_interp = x0 + vx0 * k * delta_t
-                y_interp = y0 + vy0 * k * delta_t
+    interval, offsets = get_frame_offsets(time_steps, steps_per_interval)
 
-                interpolated_positions.append((x_interp, y_interp, vx0, vy0))
+    new_time_steps = np.empty(len(interval) + 1)
+    new_time_steps[:-1] = time_steps[interval] + offsets
+    new_time_steps[-1] = time_steps[-1]
 
-            new_time_steps.append(interpolated_time)
-            new_particle_data.append(interpolated_positions)
+    new_particle_data = np.empty((len(interval) + 1,) + particle_data.shape[1:])
+    new_particle_data[:-1] = particle_data[interval]
+
+    # Use MRU for x and y, velocities are kept
+    new_particle_data[:-1, :, :2] += (
+        particle_data[interval, :, 2:] * offsets[:, np.newaxis, np.newaxis]
+    )
 
     # Append the final time step and positions
-    new_time_steps.append(time_steps[-1])
-    new_particle_data.append(particle_data[-1])
+    new_particle_data[-1] = particle_data[-1]
 
     return new_time_steps, new_particle_data
 
@@ -85,34 +94,83 @@ def calculate_steps_per_interval(time_steps, total_steps):
     return steps_per_interval.tolist()
 
 
+# Same frame times as add_intermediate_positions
+def get_interpolated_times(time_steps, steps_per_interval):
+    time_steps = np.asarray(time_steps, dtype=np.float64)
+    interval, offsets = get_frame_offsets(time_steps, steps_per_interval)
+
+    times = np.empty(len(interval) + 1)
+    times[:-1] = time_steps[interval] + offsets
+    times[-1] = time_steps[-1]
+
+    return times
+
+
+class InterpolatedFrames:
+    """
+    Frames of an animation computed when they are requested, so memory stays at one frame
+    whatever the number of frames.
+
+    :param time_steps: Array of original time steps (collisions).
+    :param particle_data: Array (snapshots, particles, 4) of particle positions and velocities, may be memory mapped.
+    :param times: Array of the frame times, see get_interpolated_times.
+    """
+
+    def __init__(self, time_steps, particle_data, times):
+        self.time_steps = np.asarray(time_steps, dtype=np.float64)
+        self.particle_data = particle_data
+        self.times = times
+
+        self.last_frame = None
+        self.last_positions = None
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, frame):
+        if frame == self.last_frame:
+            return self.last_positions
+
+        # MRU from the last snapshot at or before the frame time
+        positions = utils.resample_snapshots(
+            self.time_steps, self.particle_data, self.times[frame : frame + 1]
+        )[0]
+
+        self.last_frame = frame
+        self.last_positions = positions
+
+        return positions
+
+
+# print per 5% progress
+def print_progress(frame, frame_count):
+    if frame_count // 20 and frame % (frame_count // 20) == 0:
+        print(f"Progress: {frame / frame_count * 100}")
+
+
 # Animation function
 def update(frame, circles, particle_data):
+    print_progress(frame, len(particle_data))
 
-    # print per 5% progress
-    if len(particle_data) // 20 and frame % (len(particle_data) // 20) == 0:
-        print(f"Progress: {frame / len(particle_data) * 100}")
+    positions = particle_data[frame]
 
     for i, circle in enumerate(circles):
-        x, y, _, _ = particle_data[frame][i]
+        x, y, _, _ = positions[i]
         circle.set_center((x, y))
 
     return circles
 
 
-def animate_particles(
-    static_config,
-    time_steps,
-    particle_data,
-    interpolate=True,
-    output_file="data/particle_animation.mp4",
-):
+# Animation function for the collection renderer, a single artist for every particle
+def update_collection(frame, collection, particle_data):
+    print_progress(frame, len(particle_data))
 
-    if len(time_steps) < 5000 and interpolate:
-        steps_per_interval = calculate_steps_per_interval(time_steps, 5000)
-        time_steps, particle_data = add_intermediate_positions(
-            time_steps, particle_data, steps_per_interval
-        )
+    collection.set_offsets(particle_data[frame][:, :2])
+
+    return [collection]
 
+
+def create_figure(static_config):
     # Set up figure and axis size (10, 10)
     fig, ax = plt.subplots(figsize=(10, 10))
 
@@ -151,53 +209,350 @@ def animate_particles(
     ax.set_xticks([])
     ax.set_yticks([])
 
-    # Circles
+    return fig, ax
+
+
+def create_circles(ax, static_config, positions):
     particle_radius = static_config["particle_radius"]
 
     circles = [
-        plt.Circle((x, y), particle_radius, color="blue")
-        for x, y, _, _ in particle_data[0]
+        plt.Circle((x, y), particle_radius, color="blue") for x, y, _, _ in positions
     ]
 
     if static_config["obstacle_type"] == "free":
         circles[-1].set_color("red")
         circles[-1].set_radius(static_config["obstacle_radius"])
 
-    print("Creating animation...")
-
     for circle in circles:
         ax.add_artist(circle)
 
-    ani = animation.FuncAnimation(
-        fig,
-        update,
-        frames=len(time_steps),
-        interval=30,
-        fargs=(circles, particle_data),
-        blit=True,
+    return circles
+
+
+def create_collection(ax, static_config, positions):
+    particle_count = len(positions)
+
+    # Sizes are diameters in data units, so they scale like the circles
+    diameters = np.full(particle_count, 2 * static_config["particle_radius"])
+    colors = ["blue"] * particle_count
+
+    if static_config["obstacle_type"] == "free":
+        diameters[-1] = 2 * static_config["obstacle_radius"]
+        colors[-1] = "red"
+
+    collection = EllipseCollection(
+        diameters,
+        diameters,
+        np.zeros(particle_count),
+        units="xy",
+        offsets=np.asarray(positions)[:, :2],
+        offset_transform=ax.transData,
+        facecolors=colors,
+        edgecolors="none",
+    )
+    ax.add_collection(collection)
+
+    return collection
+
+
+# Writes every frame as raw RGB to an ffmpeg process, skipping the animation
+# writer. The static background is drawn once and restored before each frame
+def pipe_to_ffmpeg(fig, draw_frame, frames, output_file, fps):
+    canvas = FigureCanvasAgg(fig)
+
+    # Animated artists are left out of the background
+    for artist in draw_frame(frames[0]):
+        artist.set_animated(True)
+
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+    width, height = canvas.get_width_height()
+
+    command = [
+        plt.rcParams["animation.ffmpeg_path"],
+        "-y",
+        "-loglevel",
+        "error",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "rgb24",
+        "-s",
+        f"{width}x{height}",
+        "-r",
+        str(fps),
+        "-i",
+        "-",
+        "-vcodec",
+        "libx264",
+        "-pix_fmt",
+        "yuv420p",
+        output_file,
+    ]
+
+    process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    try:
+        for frame in frames:
+            canvas.restore_region(background)
+
+            for artist in draw_frame(frame):
+                fig.draw_artist(artist)
+
+            rgba = np.asarray(canvas.buffer_rgba())
+            process.stdin.write(rgba[:, :, :3].tobytes())
+    finally:
+        process.stdin.close()
+        process.wait()
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+
+def is_interpolated(time_steps, interpolate):
+    return len(time_steps) < 5000 and interpolate
+
+
+# Times of the frames, the snapshot times or the interpolated ones
+def get_frame_times(time_steps, interpolate):
+    if is_interpolated(time_steps, interpolate):
+        steps_per_interval = calculate_steps_per_interval(time_steps, 5000)
+        return get_interpolated_times(time_steps, steps_per_interval)
+
+    return time_steps
+
+
+def prepare_frames(time_steps, particle_data, interpolate):
+    # Frames are interpolated as they are drawn, see InterpolatedFrames
+    if is_interpolated(time_steps, interpolate):
+        times = get_frame_times(time_steps, interpolate)
+        return times, InterpolatedFrames(time_steps, particle_data, times)
+
+    return time_steps, particle_data
+
+
+# Renders the given frame indices of particle_data to output_file
+def render_frames(static_config, particle_data, frames, output_file, renderer, pipe):
+    fig, ax = create_figure(static_config)
+
+    # Circles draw one artist per particle, the collection a single one for all
+    # of them, which is much faster for large N
+    if renderer == "collection":
+        artist = create_collection(ax, static_config, particle_data[frames[0]])
+        update_function = update_collection
+    else:
+        artist = create_circles(ax, static_config, particle_data[frames[0]])
+        update_function = update
+
+    interval = 30
+
+    if pipe:
+        pipe_to_ffmpeg(
+            fig,
+            lambda frame: update_function(frame, artist, particle_data),
+            frames,
+            output_file,
+            1000 / interval,
+        )
+    else:
+        ani = animation.FuncAnimation(
+            fig,
+            update_function,
+            frames=frames,
+            interval=interval,
+            fargs=(artist, particle_data),
+            blit=True,
+        )
+
+        ani.save(output_file)
+
+    plt.close(fig)
+
+
+# Runs in a worker process. It only receives the snapshot times and reads the
+# snapshots its frames are drawn from from directory, so the workers never
+# hold a copy of the whole simulation
+def render_chunk(
+    static_config,
+    directory,
+    time_steps,
+    interpolate,
+    frames,
+    segment_file,
+    renderer,
+    pipe,
+):
+    particle_count = static_config["particle_count"]
+
+    if is_interpolated(time_steps, interpolate):
+        times = get_frame_times(time_steps, interpolate)[frames.start : frames.stop]
+
+        # From the last snapshot at or before the first frame to the last frame
+        start = np.searchsorted(time_steps, times[0], side="right") - 1
+        stop = np.searchsorted(time_steps, times[-1], side="right")
+
+        snapshot_times, snapshots = utils.load_simulation_snapshot_range(
+            directory, particle_count, start, stop
+        )
+        chunk_data = InterpolatedFrames(snapshot_times, snapshots, times)
+    else:
+        _, chunk_data = utils.load_simulation_snapshot_range(
+            directory, particle_count, frames.start, frames.stop
+        )
+
+    render_frames(
+        static_config, chunk_data, range(len(frames)), segment_file, renderer, pipe
     )
 
-    ani.save(output_file)
+
+# Joins the segments without reencoding them
+def concat_segments(segment_files, output_file):
+    list_file = output_file + ".segments.txt"
+
+    with open(list_file, "w") as file:
+        for segment_file in segment_files:
+            file.write(f"file '{os.path.abspath(segment_file)}'\n")
+
+    command = [
+        plt.rcParams["animation.ffmpeg_path"],
+        "-y",
+        "-loglevel",
+        "error",
+        "-f",
+        "concat",
+        "-safe",
+        "0",
+        "-i",
+        list_file,
+        "-c",
+        "copy",
+        output_file,
+    ]
+
+    try:
+        subprocess.run(command, check=True)
+    finally:
+        os.remove(list_file)
+
+
+def animate_particles(
+    static_config,
+    time_steps,
+    particle_data,
+    interpolate=True,
+    output_file="data/particle_animation.mp4",
+    renderer="circles",
+    pipe=False,
+    workers=1,
+    directory=None,
+):
+    print("Creating animation...")
+
+    if workers <= 1:
+        frame_times, frames_data = prepare_frames(time_steps, particle_data, interpolate)
+        render_frames(
+            static_config,
+            frames_data,
+            range(len(frame_times)),
+            output_file,
+            renderer,
+            pipe,
+        )
+        return
+
+    # Every worker renders a contiguous chunk of frames with its own figure to
+    # a segment, which are joined in order at the end. Workers read their
+    # snapshots from the simulation directory themselves, so particle_data is
+    # not used and may be None
+    if directory is None:
+        raise ValueError("Rendering with several workers needs the simulation directory")
+
+    frame_count = len(get_frame_times(time_steps, interpolate))
+
+    chunks = [
+        range(chunk[0], chunk[-1] + 1)
+        for chunk in np.array_split(np.arange(frame_count), workers)
+        if len(chunk)
+    ]
+
+    root, extension = os.path.splitext(output_file)
+    segment_files = [f"{root}.part{i:03d}{extension}" for i in range(len(chunks))]
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    render_chunk,
+                    static_config,
+                    directory,
+                    np.asarray(time_steps),
+                    interpolate,
+                    chunk,
+                    segment_file,
+                    renderer,
+                    pipe,
+                )
+                for chunk, segment_file in zip(chunks, segment_files)
+            ]
+
+            for future in futures:
+                future.result()
+
+        concat_segments(segment_files, output_file)
+    finally:
+        for segment_file in segment_files:
+            if os.path.exists(segment_file):
+                os.remove(segment_file)
 
 
 # Main
 if __name__ == "__main__":
 
-    # Directory as argument
-    if len(sys.argv) != 2:
-        print("Usage: python animate.py <directory>")
+    # Directory as argument, --collection renders every particle with a single
+    # artist, --pipe sends the frames straight to ffmpeg and --workers renders
+    # chunks of frames in parallel processes
+    usage = "Usage: python animate.py <directory> [--collection] [--pipe] [--workers <count>]"
+
+    if len(sys.argv) < 2:
+        print(usage)
+        sys.exit(1)
+
+    flags = sys.argv[2:]
+    workers = 1
+
+    if "--workers" in flags:
+        index = flags.index("--workers")
+        if index + 1 >= len(flags) or not flags[index + 1].isdigit():
+            print(usage)
+            sys.exit(1)
+
+        workers = int(flags[index + 1])
+        del flags[index : index + 2]
+
+    if any(flag not in ("--collection", "--pipe") for flag in flags):
+        print(usage)
         sys.exit(1)
 
     static_file = sys.argv[1] + "/static.txt"
-    snapshots_file = sys.argv[1] + "/snapshots.txt"
     output_file = sys.argv[1] + "/particle_animation.mp4"
 
     static_config = utils.load_static_data(static_file)
-    time_steps, particle_data = utils.load_snapshot_data(snapshots_file, static_config["particle_count"], static_config["snapshot_count"])
+
+    # With several workers each one reads its own snapshots, only their times
+    # are loaded here
+    if workers > 1:
+        time_steps = utils.load_simulation_snapshot_times(sys.argv[1], static_config["particle_count"])
+        particle_data = None
+    else:
+        time_steps, particle_data = utils.load_simulation_snapshots(sys.argv[1], static_config["particle_count"], static_config["snapshot_count"])
     animate_particles(
         static_config,
         time_steps,
         particle_data,
         interpolate=False,
         output_file=output_file,
+        renderer="collection" if "--collection" in flags else "circles",
+        pipe="--pipe" in flags,
+        workers=workers,
+        directory=sys.argv[1],
     )
@@ -0,0 +1,84 @@
+import numpy as np
+import os
+import sys
+import tempfile
+import time
+import utils
+
+
+# Writes a snapshots.txt with the same layout as FileUtil.serializeOutput
+def write_synthetic_snapshots(snapshots_file, particle_count, snapshot_count, seed=0):
+    rng = np.random.default_rng(seed)
+    times = np.sort(rng.uniform(0, 10, snapshot_count))
+    times[0] = 0
+
+    with open(snapshots_file, "w") as file:
+        for t in times:
+            file.write(f"{t}\n")
+            rows = rng.uniform(-0.05, 0.05, (particle_count, 4))
+            np.savetxt(file, rows, fmt="%.5f")
+
+
+# Best wall time of a few calls, along with the last result
+def time_call(function, *args, repeat=3):
+    best = float("inf")
+    result = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+
+    return best, result
+
+
+def benchmark_snapshots(directory=None, particle_count=201, snapshot_count=5000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if directory is None:
+            snapshots_file = os.path.join(tmp_dir, "snapshots.txt")
+            print(
+                f"Writing synthetic snapshots ({snapshot_count} snapshots, {particle_count} particles)"
+            )
+            write_synthetic_snapshots(snapshots_file, particle_count, snapshot_count)
+        else:
+            static_config = utils.load_static_data(os.path.join(directory, "static.txt"))
+            particle_count = static_config["particle_count"]
+            snapshot_count = static_config["snapshot_count"]
+            snapshots_file = os.path.join(directory, "snapshots.txt")
+
+        size = os.path.getsize(snapshots_file) / 1024**2
+        print(f"Loading {snapshots_file} ({size:.1f} MB)")
+
+        per_line_time, (per_line_times, per_line_snapshots) = time_call(
+            utils.load_snapshot_data_per_line,
+            snapshots_file,
+            particle_count,
+            snapshot_count,
+        )
+        bulk_time, (bulk_times, bulk_snapshots) = time_call(
+            utils.load_snapshot_data, snapshots_file, particle_count, snapshot_count
+        )
+
+    if not (
+        np.array_equal(per_line_times, bulk_times)
+        and np.array_equal(per_line_snapshots, bulk_snapshots)
+    ):
+        raise AssertionError("Bulk loader does not match the per line loader")
+
+    print(f"Per line loader: {per_line_time:.3f} s")
+    print(f"Bulk loader:     {bulk_time:.3f} s ({per_line_time / bulk_time:.1f}x)")
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python benchmark.py <snapshots> [directory]")
+        sys.exit(1)
+
+    directory = sys.argv[2] if len(sys.argv) == 3 else None
+
+    if sys.argv[1] == "snapshots":
+        benchmark_snapshots(directory)
+    else:
+        print("Usage: python benchmark.py <snapshots> [directory]")
+        sys.exit(1)
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import utils
+
+# Bump to invalidate every entry when the output or analysis format changes
+CACHE_VERSION = 2
+
+DEFAULT_MAX_SIZE_GIGS = 20
+
+
+# Content address of a parameter set: the same parameters always map to the
+# same entry, whatever their order
+def get_cache_key(parameters):
+    serialized = json.dumps(
+        {"version": CACHE_VERSION, **parameters}, sort_keys=True, default=str
+    )
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def get_entry_dir(cache_dir, parameters):
+    return os.path.join(cache_dir, get_cache_key(parameters))
+
+
+# Marks an entry as recently used, eviction removes the least recently used
+def touch_entry(entry_dir):
+    now = time.time()
+    os.utime(entry_dir, (now, now))
+
+
+# Directory with the cached output of the simulation run with parameters
+def get_simulation_dir(cache_dir, parameters):
+    entry_dir = get_entry_dir(cache_dir, parameters)
+    if not os.path.exists(os.path.join(entry_dir, "static.txt")):
+        return None
+
+    touch_entry(entry_dir)
+    return entry_dir
+
+
+# Moves a finished simulation output into the cache and returns its new location
+def store_simulation(cache_dir, parameters, simulation_dir):
+    entry_dir = get_entry_dir(cache_dir, parameters)
+    os.makedirs(entry_dir, exist_ok=True)
+
+    with open(os.path.join(entry_dir, "parameters.json"), "w") as file:
+        json.dump(parameters, file, indent=4, default=str)
+
+    # static.txt goes last, it marks the entry as complete
+    names = sorted(os.listdir(simulation_dir), key=lambda name: name == "static.txt")
+    for name in names:
+        os.replace(os.path.join(simulation_dir, name), os.path.join(entry_dir, name))
+
+    os.rmdir(simulation_dir)
+    touch_entry(entry_dir)
+
+    return entry_dir
+
+
+def get_analysis_file(cache_dir, parameters, analysis_parameters):
+    return os.path.join(
+        get_entry_dir(cache_dir, parameters),
+        f"analysis-{get_cache_key(analysis_parameters)}.npz",
+    )
+
+
+# Cached analysis result of a simulation, None if it was never analyzed with
+# these analysis parameters
+def load_analysis(cache_dir, parameters, analysis_parameters):
+    analysis_file = get_analysis_file(cache_dir, parameters, analysis_parameters)
+    if not os.path.exists(analysis_file):
+        return None
+
+    analysis = utils.load_results(analysis_file)[0]
+
+    touch_entry(os.path.dirname(analysis_file))
+    return analysis
+
+
+def store_analysis(cache_dir, parameters, analysis_parameters, analysis):
+    analysis_file = get_analysis_file(cache_dir, parameters, analysis_parameters)
+    os.makedirs(os.path.dirname(analysis_file), exist_ok=True)
+
+    # Written aside and renamed, so a partial file is never loaded
+    utils.save_results([analysis], analysis_file + ".tmp.npz")
+    os.replace(analysis_file + ".tmp.npz", analysis_file)
+
+    touch_entry(os.path.dirname(analysis_file))
+
+
+def get_entry_size(entry_dir):
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for path, _, names in os.walk(entry_dir)
+        for name in names
+    )
+
+
+# Removes the least recently used entries until the cache fits in max_size_gigs
+def evict(cache_dir, max_size_gigs=DEFAULT_MAX_SIZE_GIGS):
+    if not os.path.exists(cache_dir):
+        return
+
+    entries = [
+        os.path.join(cache_dir, name)
+        for name in os.listdir(cache_dir)
+        if os.path.isdir(os.path.join(cache_dir, name))
+    ]
+    entries.sort(key=os.path.getmtime)
+
+    sizes = {entry: get_entry_size(entry) for entry in entries}
+    total_size = sum(sizes.values())
+    max_size = max_size_gigs * 1024**3
+
+    for entry in entries:
+        if total_size <= max_size:
+            break
+
+        print(f"Evicting {entry} from the cache")
+        shutil.rmtree(entry, ignore_errors=True)
+        total_size -= sizes[entry]
@@ -7,38 +7,105 @@ Teórica 0 para obtener el coeficiente de difusión (D). Describir con detalle c
 temporales (dt) no uniformes debido a la inhomogeneidad de los eventos.
 """
 
+import fitting
 import numpy as np
+import os
 import utils
 import plots
 import sys
 
+# Stationary period from 0.4s
+NON_STATIONARY_PERIOD = 0.4
+
+# Longest lag of the time origin averaged MSD, as a fraction of the stationary
+# window. Longer lags have too few time origins to average
+MAX_LAG_FRACTION = 0.5
+
+
+# Standard error of the mean over the runs (the rows) at each time
+def get_standard_error(values):
+    return np.std(values, axis=0, ddof=1) / np.sqrt(len(values))
+
+
+# Times and states of the big particle (the last row of each snapshot). The
+# trajectory written with -tr is used when there is one, otherwise the
+# snapshots are read through the sidecar index, without the other particles
+def load_big_particle_states(directory, particle_count):
+    if os.path.exists(os.path.join(directory, "trajectory.txt")) or os.path.exists(
+        os.path.join(directory, "trajectory.bin")
+    ):
+        trajectory = utils.load_trajectory(directory)
+        return utils.get_particle_trajectory(trajectory, particle_count - 1)
+
+    return utils.load_particle_trajectory(
+        os.path.join(directory, "snapshots.txt"), particle_count, particle_count - 1
+    )
+
 
 def calculate_big_particle_squared_dispacement(
-    dynamic_file, particle_count, event_count, discrete_times
+    directory, particle_count, event_count, discrete_times
 ):
-    with open(dynamic_file, "r") as file:
-        lines = file.readlines()
+    snapshot_times, big_particle_data = load_big_particle_states(
+        directory, particle_count
+    )
+
+    # Big particle position at each discrete time, moved from the last snapshot
+    positions = utils.resample_snapshots(
+        snapshot_times, big_particle_data[:, np.newaxis, :], discrete_times
+    )[:, 0, :2]
+
+    initial_pos = big_particle_data[0, :2]
+
+    return np.sum((positions - initial_pos) ** 2, axis=1)
+
+
+# Sum over k of x[k] * x[k + m] for every lag m, with an FFT zero padded to
+# avoid the circular wrap around
+def autocorrelation(x):
+    count = len(x)
+    transform = np.fft.rfft(x, n=2 * count)
+
+    return np.fft.irfft(transform * np.conj(transform), n=2 * count)[:count]
+
 
-    step = particle_count + 1  # 1x el tiempo otro x la big particle
-    event_times = np.array([float(line.strip().split()[0]) for line in lines[::step]])
+# Mean squared displacement for every lag m over all the time origins k of
+# uniformly sampled positions: mean over k of |r(k + m) - r(k)|^2. Expanding the
+# square leaves sums of |r(k)|^2, computed with cumulative sums, and the
+# autocorrelation of the positions, so the cost is O(T log T) instead of O(T^2)
+def calculate_time_origin_msd(positions):
+    count = len(positions)
+    origins = count - np.arange(count)
 
-    # _, particles = utils.load_dynamic_data(dynamic_file, particle_count, event_count)
-    # print(particles[:,-1:][:,:,0:2].reshape(event_count, 2))
-    big_particle_data = np.array(
-        [line.strip().split()[0:2] for line in lines[step - 1 :: step]], dtype=float
+    squares = np.sum(positions**2, axis=1)
+    cumulative = np.concatenate(([0.0], np.cumsum(squares)))
+
+    # Sum of |r(k)|^2 over k < count - m plus sum of |r(k + m)|^2 over the same k
+    square_sums = cumulative[origins] + (cumulative[-1] - cumulative[count - origins])
+
+    cross_sums = sum(autocorrelation(positions[:, i]) for i in range(positions.shape[1]))
+
+    return (square_sums - 2 * cross_sums) / origins
+
+
+# Time origin averaged MSD of the big particle, with origins in the stationary
+# regime after non_stationary_period. Positions are resampled exactly on a
+# uniform grid of time_step, returns the lags and the MSD at each one
+def calculate_big_particle_time_origin_msd(
+    directory, particle_count, t_max, time_step, non_stationary_period
+):
+    snapshot_times, big_particle_data = load_big_particle_states(
+        directory, particle_count
     )
-    # print(big_particle_data)
-    squared_displacements = []
-    initial_pos = big_particle_data[0]
 
-    for t in discrete_times:
-        i = (np.abs(event_times - t)).argmin()
-        pos = big_particle_data[i]
+    times = np.arange(non_stationary_period, t_max, time_step)
+    positions = utils.resample_snapshots(
+        snapshot_times, big_particle_data[:, np.newaxis, :], times
+    )[:, 0, :2]
 
-        squared_displacement = np.sum((pos - initial_pos) ** 2)
-        squared_displacements.append(squared_displacement)
+    msd = calculate_time_origin_msd(positions)
+    lag_count = max(int(len(times) * MAX_LAG_FRACTION), 1)
 
-    return squared_displacements
+    return np.arange(lag_count) * time_step, msd[:lag_count]
 
 
 if __name__ == "__main__":
@@ -64,35 +131,54 @@ if __name__ == "__main__":
         o_r = 0.005
 
         all_displacements = []
+        all_origin_displacements = []
         num_simulations = 10
         time_step = 0.02
 
         times = np.arange(0, t, time_step)
 
         for i in range(num_simulations):
+            # Only the big particle trajectory is needed, so a single snapshot
+            # is written and its trajectory goes to its own file
             dir = utils.execute_simulation(
-                N, r, m, domain, sz, o_r, v, t, i, 12, out, obs, o_m, 100
+                N, r, m, domain, sz, o_r, v, t, i, 12, out, obs, o_m, 100000000, track=True
             )
             static_file = dir + "/static.txt"
             static_config = utils.load_static_data(static_file)
-            snapshots_file = dir + "/snapshots.txt"
             displacement = calculate_big_particle_squared_dispacement(
-                snapshots_file,
+                dir,
                 static_config["particle_count"],
                 static_config["event_count"],
                 discrete_times=times,
             )
             all_displacements.append(displacement)
 
+            lags, origin_displacement = calculate_big_particle_time_origin_msd(
+                dir,
+                static_config["particle_count"],
+                t,
+                time_step,
+                NON_STATIONARY_PERIOD,
+            )
+            all_origin_displacements.append(origin_displacement)
+
         all_displacements = np.array(all_displacements)
+        all_origin_displacements = np.array(all_origin_displacements)
 
         mean_squared_displacement = np.mean(all_displacements, axis=0)
         std_squared_displacement = np.std(all_displacements, axis=0)
 
         np.savetxt("data/msd.txt", mean_squared_displacement)
         np.savetxt("data/std_msd.txt", std_squared_displacement)
+        np.savetxt("data/sem_msd.txt", get_standard_error(all_displacements))
         np.savetxt("data/times.txt", times)
 
+        # Averaged over the time origins of each run and then over the runs
+        np.savetxt("data/msd_origins.txt", np.mean(all_origin_displacements, axis=0))
+        np.savetxt("data/std_msd_origins.txt", np.std(all_origin_displacements, axis=0))
+        np.savetxt("data/sem_msd_origins.txt", get_standard_error(all_origin_displacements))
+        np.savetxt("data/lags.txt", lags)
+
 
         sys.exit(0)
 
@@ -102,40 +188,60 @@ if __name__ == "__main__":
         std_squared_displacement = np.loadtxt("data/std_msd.txt")
         times = np.loadtxt("data/times.txt")
 
+        if not os.path.exists("data/sem_msd.txt"):
+            print("data/sem_msd.txt is missing, run python dcm.py generate again")
+            sys.exit(1)
+        sem_squared_displacement = np.loadtxt("data/sem_msd.txt")
 
-        # Stationary period from 0.5s, so we split up to 0.5
-        non_stationary_period = 0.4
+
+        non_stationary_period = NON_STATIONARY_PERIOD
 
         plots.plot_msd(times, mean_squared_displacement, std_squared_displacement, non_stationary_period, "data/msd.png")
 
+        # Time origin averaged MSD, its times are lags from each origin
+        if os.path.exists("data/msd_origins.txt"):
+            plots.plot_msd(
+                np.loadtxt("data/lags.txt"),
+                np.loadtxt("data/msd_origins.txt"),
+                np.loadtxt("data/std_msd_origins.txt"),
+                None,
+                "data/msd_origins.png",
+            )
+
+        # D is fitted on the time origin averaged MSD when there is one, over
+        # the same early window of lags. Otherwise on the single origin curve
+        if os.path.exists("data/msd_origins.txt"):
+            times = np.loadtxt("data/lags.txt")
+            mean_squared_displacement = np.loadtxt("data/msd_origins.txt")
+            std_squared_displacement = np.loadtxt("data/std_msd_origins.txt")
+            sem_squared_displacement = np.loadtxt("data/sem_msd_origins.txt")
 
         mean_squared_displacement = mean_squared_displacement[times < non_stationary_period]
         std_squared_displacement = std_squared_displacement[times < non_stationary_period]
+        sem_squared_displacement = sem_squared_displacement[times < non_stationary_period]
         times = times[times < non_stationary_period]
 
-        # Range of diffusion coefficients (D values) to test
-        D_values = np.linspace(0, 1.1e-3, 50)
-
-        # Calculo error cuadratico
-        se_values = []
-        for D in D_values:
-
-            # Linea de ajuste
-            predicted_msd = 4 * D * times
-
-            # Error cuadratico medio
-            se = np.sum((mean_squared_displacement - predicted_msd) ** 2)
-            se_values.append(se)
+        # Exact least squares D, and weighting each point by the standard error
+        # of its mean over the runs
+        best_D, D_uncertainty = fitting.fit_diffusion_coefficient(
+            times, mean_squared_displacement
+        )
+        weighted_D, weighted_D_uncertainty = fitting.fit_diffusion_coefficient_weighted(
+            times, mean_squared_displacement, sem_squared_displacement
+        )
 
-        mse_values = np.array(se_values)
+        print(f"D = {best_D:.4e} ± {D_uncertainty:.1e} m^2/s")
+        print(f"Weighted D = {weighted_D:.4e} ± {weighted_D_uncertainty:.1e} m^2/s")
 
-        # Minimo error
-        best_D_index = np.argmin(mse_values)
-        best_D = D_values[best_D_index]
+        # Error curve around the best D
+        D_values = np.linspace(0, 2 * best_D, 50)
+        mse_values = fitting.get_squared_errors(
+            times, mean_squared_displacement, D_values
+        )
 
-        
         best_fit_msd = 4 * best_D * times
 
+        # The error bars are the run to run spread, not the error of the mean
         plots.plot_msd_with_fit(times, mean_squared_displacement, std_squared_displacement, best_fit_msd, best_D, "data/msd_fit.png")
         plots.plot_se_vs_D(D_values, mse_values, best_D, "data/mse_vs_D.png")
 
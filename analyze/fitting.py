@@ -0,0 +1,59 @@
+import numpy as np
+
+# Least squares fits of the diffusion coefficient D to an MSD curve with the
+# model MSD = 4 D t, a line through the origin
+
+
+# Squared error of the model for every D in D_values at once
+def get_squared_errors(times, msd, D_values):
+    times = np.asarray(times, dtype=np.float64)
+    msd = np.asarray(msd, dtype=np.float64)
+    D_values = np.asarray(D_values, dtype=np.float64)
+
+    predicted_msd = 4 * D_values[:, np.newaxis] * times[np.newaxis, :]
+
+    return np.sum((msd[np.newaxis, :] - predicted_msd) ** 2, axis=1)
+
+
+# D that minimizes the squared error, the root of its derivative:
+# D = sum(t * msd) / (4 * sum(t^2)). The uncertainty comes from the residual
+# variance of the fit, with one fitted parameter
+def fit_diffusion_coefficient(times, msd):
+    times = np.asarray(times, dtype=np.float64)
+    msd = np.asarray(msd, dtype=np.float64)
+
+    squared_times = np.sum(times**2)
+    if squared_times == 0:
+        raise ValueError("Cannot fit D without points at t > 0")
+
+    slope = np.sum(times * msd) / squared_times
+
+    residual_variance = np.sum((msd - slope * times) ** 2) / max(len(times) - 1, 1)
+    slope_uncertainty = np.sqrt(residual_variance / squared_times)
+
+    return slope / 4, slope_uncertainty / 4
+
+
+# Same fit weighting each point by 1 / sem^2, where sem is the standard error
+# of the mean MSD over the runs (std / sqrt(runs)), not the run to run spread.
+# The noisier points at long times count less. Points with no error (t = 0)
+# carry no information on the slope and are left out. The uncertainty is the
+# propagated sem of the points
+def fit_diffusion_coefficient_weighted(times, msd, sem):
+    times = np.asarray(times, dtype=np.float64)
+    msd = np.asarray(msd, dtype=np.float64)
+    sem = np.asarray(sem, dtype=np.float64)
+
+    valid = sem > 0
+    weights = 1 / sem[valid] ** 2
+    times = times[valid]
+    msd = msd[valid]
+
+    weighted_squared_times = np.sum(weights * times**2)
+    if weighted_squared_times == 0:
+        raise ValueError("Cannot fit D without points at t > 0 with sem > 0")
+
+    slope = np.sum(weights * times * msd) / weighted_squared_times
+    slope_uncertainty = 1 / np.sqrt(weighted_squared_times)
+
+    return slope / 4, slope_uncertainty / 4
@@ -8,33 +8,20 @@ def plot_collision_with_obstacle_vs_time(
 ):
     fig, ax = plt.subplots()
 
-    # Collision counts is a list of dict [time, count].
-    # e.g. {0: 0, 1: 1, 2: 20}
+    # Collision counts is a list of dict with the "times" and "counts" arrays.
+    # e.g. {"times": [0.1, 0.4, 0.5], "counts": [1, 2, 3]}
     for i, collision_count in enumerate(collision_counts):
-        times = list(collision_count.keys())
-
-        # Times is string, convert to double
-        times = [float(time) for time in times]
-
-        counts = list(collision_count.values())
-
-        ax.plot(times, counts, label=labels[i])
+        ax.plot(collision_count["times"], collision_count["counts"], label=labels[i])
 
     ax.set_xlabel("Tiempo (s)")
     ax.set_ylabel("Colisiones")
 
     # 10 Ticks
     max_time = max(
-        [
-            max(map(float, collision_count.keys()))
-            for collision_count in collision_counts
-        ]
+        [max(collision_count["times"]) for collision_count in collision_counts]
     )
     min_time = min(
-        [
-            min(map(float, collision_count.keys()))
-            for collision_count in collision_counts
-        ]
+        [min(collision_count["times"]) for collision_count in collision_counts]
     )
     step = (max_time - min_time) / 4  # 9 intervals create 10 ticks
     steps = [round(min_time + i * step, 2) for i in range(5)]
@@ -71,33 +58,20 @@ def plot_collided_particles_count_vs_time(
 ):
     fig, ax = plt.subplots()
 
-    # Collision counts is a list of dict [time, count].
-    # e.g. {0: 0, 1: 1, 2: 20}
+    # Collision counts is a list of dict with the "times" and "counts" arrays.
+    # e.g. {"times": [0.1, 0.4, 0.5], "counts": [1, 2, 3]}
     for i, collision_count in enumerate(collided_particles_count):
-        times = list(collision_count.keys())
-
-        # Times is string, convert to double
-        times = [float(time) for time in times]
-
-        counts = list(collision_count.values())
-
-        ax.plot(times, counts, label=labels[i])
+        ax.plot(collision_count["times"], collision_count["counts"], label=labels[i])
 
     ax.set_xlabel("Tiempo (s)")
     ax.set_ylabel("Particulas colisionadas")
 
     # 10 Ticks
     max_time = max(
-        [
-            max(map(float, collision_count.keys()))
-            for collision_count in collided_particles_count
-        ]
+        [max(collision_count["times"]) for collision_count in collided_particles_count]
     )
     min_time = min(
-        [
-            min(map(float, collision_count.keys()))
-            for collision_count in collided_particles_count
-        ]
+        [min(collision_count["times"]) for collision_count in collided_particles_count]
     )
     step = (max_time - min_time) / 4  # 9 intervals create 10 ticks
     steps = [round(min_time + i * step, 2) for i in range(5)]
@@ -213,7 +187,8 @@ def plot_msd(
         fmt="o",
         capsize=5,
     )
-    plt.axvline(non_stationary_period, color="r", linestyle="--")
+    if non_stationary_period is not None:
+        plt.axvline(non_stationary_period, color="r", linestyle="--")
     plt.xlabel("Tiempo (s)")
     plt.ylabel("<z$^2$> (m$^2$)")
     plt.ticklabel_format(style="sci", axis="y", scilimits=(0, 0))
@@ -237,7 +212,7 @@ def plot_msd_with_fit(
         yerr=std_squared_displacement,
         fmt="o",
         capsize=5,
-        label="<z$^2$> observado",
+        label="<z$^2$> observado (± desvío entre corridas)",
     )
     plt.plot(times, best_fit_msd, "r-", label=f"Ajuste Lineal, D = {best_d:.1e} m$^2$/s")
     plt.xlabel("Tiempo (s)")
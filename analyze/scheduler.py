@@ -0,0 +1,215 @@
+import concurrent.futures
+import json
+import math
+import os
+
+# Share of the available memory that the simulations may use, the rest is left
+# for the analysis processes and the system
+MEMORY_FRACTION = 0.8
+
+# Heap estimate before any run has been recorded: a fixed JVM overhead plus a
+# cost per unit of work (see estimate_work)
+JVM_BASE_GIGS = 0.25
+GIGS_PER_WORK = 2e-5
+MIN_HEAP_GIGS = 0.5
+
+# Margin over the memory per unit of work of recent runs
+HEAP_SAFETY_FACTOR = 1.25
+
+# The heap estimate uses this percentile of the last HEAP_WINDOW runs, so a
+# single outlier neither sets the heap of every later run nor stays forever
+HEAP_WINDOW = 50
+HEAP_PERCENTILE = 90
+
+# Recorded runs kept in the history file
+HISTORY_LENGTH = 1000
+
+
+def get_available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+
+    return os.cpu_count() or 1
+
+
+def get_available_memory_gigs():
+    # MemAvailable counts reclaimable caches, unlike the free pages
+    try:
+        with open("/proc/meminfo", "r") as file:
+            for line in file:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024**2
+    except OSError:
+        pass
+
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES") / 1024**3
+
+
+# Proxy for the memory and time a run needs: the event count grows with
+# N * speed * t_max, and every skip events a snapshot of N particles is kept.
+# A batch job ({"runs": [...]}) runs its runs one after the other in a JVM, so
+# it takes the time of all of them
+def estimate_work(job):
+    if "runs" in job:
+        return sum(estimate_work(run) for run in job["runs"])
+
+    return job["N"] * job["speed"] * job["t_max"] * (1 + job["N"] / job["skip"])
+
+
+# Work that sets the heap of a job, the largest of its runs for a batch
+def estimate_peak_work(job):
+    if "runs" in job:
+        return max(estimate_work(run) for run in job["runs"])
+
+    return estimate_work(job)
+
+
+def get_run_count(job):
+    return len(job["runs"]) if "runs" in job else 1
+
+
+def load_history(history_file):
+    if history_file is None or not os.path.exists(history_file):
+        return []
+
+    with open(history_file, "r") as file:
+        return json.load(file)
+
+
+def save_history(history_file, history):
+    if history_file is None:
+        return
+
+    os.makedirs(os.path.dirname(history_file) or ".", exist_ok=True)
+
+    with open(history_file, "w") as file:
+        json.dump(history[-HISTORY_LENGTH:], file, indent=4)
+
+
+# Nearest rank percentile of a non empty list
+def get_percentile(values, percentile):
+    ordered = sorted(values)
+    rank = math.ceil(percentile / 100 * len(ordered))
+    return ordered[max(rank, 1) - 1]
+
+
+# Memory per unit of work a recorded run showed. Its RSS can grow up to the heap
+# it was granted whether it needed it or not, so the sample is capped at what
+# gives back that same heap: a run that filled its heap keeps it, and the
+# estimate can not grow from one sweep to the next on its own
+def get_gigs_per_work(run):
+    work = run.get("peak_work", run["work"])
+    gigs_per_work = (run["peak_rss_gigs"] - JVM_BASE_GIGS) / work
+
+    if "heap_gigs" in run:
+        granted = (run["heap_gigs"] - JVM_BASE_GIGS) / (HEAP_SAFETY_FACTOR * work)
+        gigs_per_work = min(gigs_per_work, granted)
+
+    return gigs_per_work
+
+
+def estimate_heap_gigs(job, history):
+    gigs_per_work = GIGS_PER_WORK
+
+    # Runs recorded before batches have no peak_work, their work is the same
+    measured = [
+        get_gigs_per_work(run)
+        for run in history
+        if run["peak_rss_gigs"] is not None and run.get("peak_work", run["work"]) > 0
+    ][-HEAP_WINDOW:]
+    if measured:
+        gigs_per_work = HEAP_SAFETY_FACTOR * get_percentile(measured, HEAP_PERCENTILE)
+
+    return max(MIN_HEAP_GIGS, JVM_BASE_GIGS + gigs_per_work * estimate_peak_work(job))
+
+
+# Seconds per unit of work in past runs, None before any run has been recorded
+def estimate_wall_time(job, history):
+    measured = [run["wall_time"] / run["work"] for run in history if run["work"] > 0]
+    if not measured:
+        return None
+
+    return sorted(measured)[len(measured) // 2] * estimate_work(job)
+
+
+# Runs run_job(job, memory_gigs, usage) for every job, largest first, keeping
+# as many running as there are CPUs and their heaps fit in the available
+# memory. Yields (job, future) as each one finishes and records the usage it
+# reported in history_file to improve later estimates.
+def schedule_simulations(
+    jobs, run_job, history_file=None, max_workers=None, available_memory_gigs=None
+):
+    history = load_history(history_file)
+
+    cpus = get_available_cpus()
+    workers = cpus if max_workers is None else min(max_workers, cpus)
+
+    if available_memory_gigs is None:
+        available_memory_gigs = get_available_memory_gigs()
+    memory_budget = available_memory_gigs * MEMORY_FRACTION
+
+    pending = []
+    for job in jobs:
+        memory_gigs = estimate_heap_gigs(job, history)
+
+        if memory_gigs > memory_budget:
+            print(
+                f"Job {job} needs an estimated {memory_gigs:.2f} GB, only {memory_budget:.2f} GB available"
+            )
+            memory_gigs = memory_budget
+
+        pending.append((job, memory_gigs))
+
+    pending.sort(key=lambda pending_job: estimate_work(pending_job[0]), reverse=True)
+
+    total_estimate = sum(
+        estimate_wall_time(job, history) or 0 for job, _ in pending
+    )
+    print(
+        f"Scheduling {sum(get_run_count(job) for job, _ in pending)} simulations"
+        f" in {len(pending)} jobs on {workers} CPUs and {memory_budget:.2f} GB"
+        + (f", about {total_estimate / workers:.0f} s" if total_estimate else "")
+    )
+
+    used_memory = 0
+    running = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+
+            # Start the largest pending jobs that fit, always at least one
+            for job, memory_gigs in list(pending):
+                if len(running) == workers:
+                    break
+
+                if running and used_memory + memory_gigs > memory_budget:
+                    continue
+
+                usage = {}
+                future = executor.submit(run_job, job, memory_gigs, usage)
+                running[future] = (job, memory_gigs, usage)
+                used_memory += memory_gigs
+                pending.remove((job, memory_gigs))
+
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+
+            for future in done:
+                job, memory_gigs, usage = running.pop(future)
+                used_memory -= memory_gigs
+
+                if future.exception() is None and usage:
+                    history.append(
+                        {
+                            **job,
+                            "work": estimate_work(job),
+                            "peak_work": estimate_peak_work(job),
+                            "heap_gigs": memory_gigs,
+                            "wall_time": usage["wall_time"],
+                            "peak_rss_gigs": usage["peak_rss_gigs"],
+                        }
+                    )
+                    save_history(history_file, history)
+
+                yield job, future
@@ -0,0 +1,45 @@
+import analyze
+import json
+import utils
+from test_utils import write_synthetic_run
+
+
+def test_energy_drift_after_the_first_snapshot_is_flagged(tmp_path):
+    # Colliding particles get random velocities, so the energy is not
+    # conserved, and with a large snapshot interval only t = 0 is written
+    write_synthetic_run(tmp_path, event_count=60, snapshot_interval=1000)
+
+    result = analyze.analyze_simulation(tmp_path, 1.0, 0.05, 0.005, 0.6, 0.1)
+
+    assert result["max_energy_drift"] > utils.ENERGY_DRIFT_TOLERANCE
+
+
+def test_legacy_results_are_converted(tmp_path):
+    legacy = {
+        "parameters": {"particle_count": 6},
+        "collision_count": {"0.2": 2, "0.1": 1},
+        "first_collision_count": {"0.1": 1},
+        "temperature": 1.5,
+        "obstacle_pressures": [0, 3.0, 4.0],
+        "wall_pressures": [0, 5.0, 6.0],
+    }
+    with open(tmp_path / "results.json", "w") as file:
+        json.dump([legacy], file)
+
+    (result,) = analyze.load_legacy_results(tmp_path / "results.json")
+
+    assert result["collision_count"] == {"times": [0.1, 0.2], "counts": [1, 2]}
+    assert result["obstacle_pressures"] == [3.0, 4.0]
+    assert result["wall_pressures"] == [5.0, 6.0]
+
+
+def test_run_seeds_differ_across_speeds():
+    seeds = {
+        analyze.get_run_seed(speed, repetition)
+        for speed in [1, 3, 6, 10]
+        for repetition in range(10)
+    }
+
+    assert len(seeds) == 40
+    assert analyze.get_run_seed(1, 0) == analyze.get_run_seed(1.0, 0)
+    assert all(0 <= seed < 2**63 for seed in seeds)
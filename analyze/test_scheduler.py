@@ -0,0 +1,43 @@
+import scheduler
+
+
+def test_heap_estimate_does_not_grow_with_the_granted_heap():
+    job = {"N": 200, "speed": 1, "t_max": 5, "skip": 100000000}
+    history = []
+
+    estimates = []
+    for _ in range(8):
+        heap_gigs = scheduler.estimate_heap_gigs(job, history)
+        estimates.append(heap_gigs)
+
+        # A JVM whose RSS follows the heap it was granted
+        history.append(
+            {
+                **job,
+                "work": scheduler.estimate_work(job),
+                "peak_work": scheduler.estimate_peak_work(job),
+                "heap_gigs": heap_gigs,
+                "wall_time": 1.0,
+                "peak_rss_gigs": heap_gigs + 0.1,
+            }
+        )
+
+    assert max(estimates[1:]) <= estimates[0]
+
+
+def test_heap_estimate_shrinks_when_runs_use_less():
+    job = {"N": 200, "speed": 1, "t_max": 5, "skip": 100000000}
+    work = scheduler.estimate_work(job)
+
+    history = [
+        {
+            **job,
+            "work": work,
+            "peak_work": work,
+            "heap_gigs": 4.0,
+            "wall_time": 1.0,
+            "peak_rss_gigs": 0.5,
+        }
+    ]
+
+    assert scheduler.estimate_heap_gigs(job, history) < 4.0
@@ -0,0 +1,419 @@
+import numpy as np
+import os
+import pytest
+import struct
+import subprocess
+import sys
+import utils
+
+
+# Formats of the events.txt lines written by the Java event classes
+ONE_PARTICLE_EVENT_FORMAT = "%.5f %s %d %5f %5f %5f %5f %5f %5f\n"
+TWO_PARTICLE_EVENT_FORMAT = "%.5f P %d %5f %5f %5f %5f %d %5f %5f %5f %5f\n"
+
+
+# Line by line event parser, the way events.txt was read before the event table
+def parse_event_lines(data):
+    codes = {"W": utils.WALL_EVENT, "O": utils.OBSTACLE_EVENT}
+    rows = []
+
+    for line in data.decode().splitlines():
+        parts = line.strip().split()
+
+        time = float(parts[0])
+        event_type = parts[1]
+        particle_id = int(parts[2])
+        event_data = list(map(float, parts[3:]))
+
+        if event_type == "P":
+            x, y, vx1, vy1, other_id, x2, y2, vx2, vy2 = event_data
+            rows.append(
+                (time, utils.PARTICLE_EVENT, particle_id, int(other_id), x, y, vx1, vy1, x2, y2, vx2, vy2)
+            )
+        else:
+            x, y, vx1, vy1, vx2, vy2 = event_data
+            rows.append(
+                (time, codes[event_type], particle_id, -1, x, y, vx1, vy1, x, y, vx2, vy2)
+            )
+
+    return np.array(rows, dtype=utils.EVENT_DTYPE)
+
+
+# Writes a small run with the layout of the Java output: static.txt, a
+# snapshot every snapshot_interval events and every event. Colliding particles
+# get random velocities, the states are kept at the precision of the files so
+# the snapshots can be rebuilt from the first one and the events
+def write_synthetic_run(
+    directory, particle_count=6, event_count=60, snapshot_interval=5, seed=0
+):
+    rng = np.random.default_rng(seed)
+
+    states = np.round(rng.uniform(-0.05, 0.05, (particle_count, 4)), 5)
+    reference_times = np.zeros(particle_count)
+
+    def write_snapshot(file, t):
+        current = states.copy()
+        current[:, :2] += current[:, 2:] * (t - reference_times)[:, np.newaxis]
+
+        file.write(f"{t}\n")
+        np.savetxt(file, current, fmt="%.5f")
+
+    def collide(particle, t):
+        states[particle, :2] += states[particle, 2:] * (t - reference_times[particle])
+        states[particle, :2] = [float(f"{value:f}") for value in states[particle, :2]]
+
+        previous = states[particle, 2:].copy()
+        states[particle, 2:] = [float(f"{value:f}") for value in rng.uniform(-0.05, 0.05, 2)]
+        reference_times[particle] = t
+
+        return previous
+
+    snapshot_count = 1
+
+    with open(os.path.join(directory, "snapshots.txt"), "w") as snapshots_file, open(
+        os.path.join(directory, "events.txt"), "w"
+    ) as events_file:
+        write_snapshot(snapshots_file, 0.0)
+
+        for k in range(1, event_count + 1):
+            t = float(f"{k * 0.01:.5f}")
+
+            if rng.random() < 0.5:
+                a, b = rng.choice(particle_count, 2, replace=False)
+                collide(a, t)
+                collide(b, t)
+                events_file.write(
+                    TWO_PARTICLE_EVENT_FORMAT % (t, a, *states[a], b, *states[b])
+                )
+            else:
+                particle = rng.integers(particle_count)
+                previous = collide(particle, t)
+                events_file.write(
+                    ONE_PARTICLE_EVENT_FORMAT
+                    % (t, rng.choice(["W", "O"]), particle, *states[particle], *previous)
+                )
+
+            if k % snapshot_interval == 0:
+                write_snapshot(snapshots_file, t)
+                snapshot_count += 1
+
+    with open(os.path.join(directory, "static.txt"), "w") as static_file:
+        static_file.write(
+            f"{particle_count}\n0.001\n1.0\n1.0\ncircular\n0.05\nobstacle\n0.005\n"
+            f"{snapshot_count}\n{event_count}\n"
+        )
+
+
+def test_parse_event_table_matches_line_parser(tmp_path):
+    write_synthetic_run(tmp_path, event_count=200)
+
+    with open(tmp_path / "events.txt", "rb") as file:
+        data = file.read()
+
+    events = utils.parse_event_table(data)
+    expected = parse_event_lines(data)
+
+    assert len(events) == 200
+    for field in utils.EVENT_DTYPE.names:
+        np.testing.assert_array_equal(events[field], expected[field], err_msg=field)
+
+
+def test_parse_event_table_without_trailing_newline():
+    data = b"0.10000 W 3 0.010000 0.020000 1.000000 2.000000 -1.000000 2.000000"
+
+    events = utils.parse_event_table(data)
+
+    np.testing.assert_array_equal(events, parse_event_lines(data))
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        # Padded field, as Java writes NaN with %5f
+        b"0.10000 W 3 0.010000   NaN 1.000000 2.000000 -1.000000 2.000000\n",
+        # Missing field
+        b"0.10000 O 3 0.010000 0.020000 1.000000 2.000000 -1.000000\n",
+        # Particle event with the fields of a wall event
+        b"0.10000 P 3 0.010000 0.020000 1.000000 2.000000 -1.000000 2.000000\n",
+        # Wall event with the fields of a particle event
+        b"0.10000 W 3 0.010000 0.020000 1.000000 2.000000 4 0.010000 0.020000 1.000000 2.000000\n",
+    ],
+)
+def test_parse_event_table_rejects_shifted_fields(line):
+    valid = b"0.05000 W 1 0.010000 0.020000 1.000000 2.000000 -1.000000 2.000000\n"
+
+    with pytest.raises(ValueError):
+        utils.parse_event_table(valid + line + valid)
+
+
+def test_reconstructed_snapshots_match_saved_snapshots(tmp_path):
+    write_synthetic_run(tmp_path, particle_count=6, event_count=60, snapshot_interval=5)
+
+    parameters = utils.load_static_data(tmp_path / "static.txt")
+    times, snapshots = utils.load_snapshot_data(
+        tmp_path / "snapshots.txt",
+        parameters["particle_count"],
+        parameters["snapshot_count"],
+    )
+
+    # A small keyframe interval so seeking goes through several keyframes
+    reconstructed = utils.reconstruct_snapshots(
+        tmp_path, parameters["particle_count"], times, keyframe_interval=7
+    )
+
+    # The snapshots are rounded to 5 decimals
+    np.testing.assert_allclose(reconstructed, snapshots, rtol=0, atol=1e-5)
+
+
+def test_last_velocities_match_reconstructed_final_state(tmp_path):
+    write_synthetic_run(tmp_path, particle_count=6, event_count=60)
+    _, events = utils.load_event_data(tmp_path / "events.txt")
+
+    blocks = [events[i : i + 7] for i in range(0, len(events), 7)]
+    last_velocities = utils.accumulate_events(
+        blocks, 0.4, {"last": utils.LastVelocityAccumulator()}
+    )["last"]
+
+    initial_time, initial_snapshot = utils.load_initial_snapshot(tmp_path, 6)
+    final_snapshot = utils.apply_last_velocities(initial_snapshot, last_velocities)
+
+    expected = utils.SnapshotReconstructor(
+        initial_time, initial_snapshot, events
+    ).state_at(0.4)
+
+    np.testing.assert_array_equal(final_snapshot[:, 2:], expected[:, 2:])
+
+
+# Binary header and records as written by FileUtil and Event.writeRecord
+def write_binary_header(file, magic, width, count):
+    file.write(struct.pack("<8siiq", magic, utils.BINARY_VERSION, width, count))
+
+
+def test_event_record_matches_event_write_record(tmp_path):
+    # time, type, id, other id, x, y, vx1, vy1, x2, y2, vx2, vy2
+    record = struct.Struct("<dbii8d")
+    records = [
+        (0.25, utils.WALL_EVENT, 3, -1, 0.01, 0.02, 1.0, 2.0, 0.01, 0.02, -1.0, 2.0),
+        (0.5, utils.PARTICLE_EVENT, 1, 4, 0.03, 0.04, 0.5, -0.5, 0.035, 0.041, -0.5, 0.5),
+        (0.75, utils.OBSTACLE_EVENT, 2, -1, 0.0, 0.005, 0.1, 0.2, 0.0, 0.005, 0.1, -0.2),
+    ]
+
+    assert record.size == 81
+    assert utils.EVENT_DTYPE.itemsize == record.size
+
+    events_file = tmp_path / "events.bin"
+    with open(events_file, "wb") as file:
+        write_binary_header(file, utils.EVENTS_MAGIC, record.size, len(records))
+        for values in records:
+            file.write(record.pack(*values))
+
+    times, events = utils.load_event_data_binary(events_file)
+
+    np.testing.assert_array_equal(times, [0.25, 0.5, 0.75])
+    np.testing.assert_array_equal(
+        events, np.array(records, dtype=utils.EVENT_DTYPE)
+    )
+
+
+def test_binary_snapshots_match_text_snapshots(tmp_path):
+    write_synthetic_run(tmp_path)
+
+    parameters = utils.load_static_data(tmp_path / "static.txt")
+    particle_count = parameters["particle_count"]
+    snapshot_count = parameters["snapshot_count"]
+
+    times, snapshots = utils.load_snapshot_data(
+        tmp_path / "snapshots.txt", particle_count, snapshot_count
+    )
+
+    # The times first, then the states of every snapshot
+    snapshots_file = tmp_path / "snapshots.bin"
+    with open(snapshots_file, "wb") as file:
+        write_binary_header(file, utils.SNAPSHOTS_MAGIC, particle_count, snapshot_count)
+        file.write(times.astype("<f8").tobytes())
+        file.write(snapshots.astype("<f8").tobytes())
+
+    binary_times, binary_snapshots = utils.load_snapshot_data_binary(snapshots_file)
+
+    np.testing.assert_array_equal(binary_times, times)
+    np.testing.assert_array_equal(binary_snapshots, snapshots)
+
+
+def test_snapshot_times_are_read_without_the_states(tmp_path):
+    write_synthetic_run(tmp_path)
+
+    parameters = utils.load_static_data(tmp_path / "static.txt")
+    times, _ = utils.load_snapshot_data(
+        tmp_path / "snapshots.txt",
+        parameters["particle_count"],
+        parameters["snapshot_count"],
+    )
+
+    np.testing.assert_array_equal(
+        utils.load_simulation_snapshot_times(tmp_path, parameters["particle_count"]),
+        times,
+    )
+
+
+def test_results_round_trip(tmp_path):
+    results = [
+        {
+            "parameters": {"particle_count": 6, "obstacle_mass": None},
+            "collision_count": {"times": [0.1, 0.2], "counts": [1, 2]},
+            "temperature": 1.5,
+            "wall_pressures": [3.0, 4.0],
+        }
+        for _ in range(2)
+    ]
+
+    utils.save_results(results, tmp_path / "results.npz")
+    loaded = utils.load_results(tmp_path / "results.npz")
+
+    assert len(loaded) == 2
+    assert loaded[1]["parameters"] == results[1]["parameters"]
+    assert loaded[1]["temperature"] == 1.5
+    np.testing.assert_array_equal(loaded[1]["collision_count"]["times"], [0.1, 0.2])
+    np.testing.assert_array_equal(loaded[1]["wall_pressures"], [3.0, 4.0])
+
+
+def test_open_results_reads_arrays_while_open(tmp_path):
+    results = [
+        {
+            "parameters": {"particle_count": 6},
+            "collision_count": {"times": [0.1, 0.2], "counts": [1, 2]},
+            "temperature": 1.5,
+        }
+    ]
+    utils.save_results(results, tmp_path / "results.npz")
+
+    with utils.open_results(tmp_path / "results.npz") as opened:
+        assert sorted(opened[0]) == ["collision_count", "parameters", "temperature"]
+        counts = opened[0]["collision_count"]["counts"]
+
+    # Arrays read inside the block outlive the file
+    np.testing.assert_array_equal(counts, [1, 2])
+
+
+def test_accumulate_events_cuts_unsorted_events_at_t_max(tmp_path):
+    write_synthetic_run(tmp_path, event_count=200)
+    _, events = utils.load_event_data(tmp_path / "events.txt")
+
+    # Out of order blocks, the cutoff can not stop at the first late event
+    shuffled = np.random.default_rng(1).permutation(events)
+    blocks = [shuffled[i : i + 16] for i in range(0, len(shuffled), 16)]
+
+    t_max = 1.0
+    metrics = utils.accumulate_events(
+        blocks,
+        t_max,
+        {
+            "count": utils.CollisionCountAccumulator(utils.OBSTACLE_EVENT),
+            "frequency": utils.CollisionFrequencyAccumulator(utils.OBSTACLE_EVENT),
+        },
+    )
+
+    expected = shuffled[
+        (shuffled["type"] == utils.OBSTACLE_EVENT) & (shuffled["time"] <= t_max)
+    ]
+    collision_times, counts = metrics["count"]
+
+    np.testing.assert_array_equal(collision_times, expected["time"])
+    np.testing.assert_array_equal(counts, np.arange(1, len(expected) + 1))
+    assert metrics["frequency"] == len(expected) / expected["time"].max()
+
+
+def test_incomplete_accumulator_fails_when_built():
+    class CountOnly(utils.EventAccumulator):
+        def add(self, events):
+            pass
+
+    with pytest.raises(TypeError):
+        CountOnly()
+
+
+# Stands in for a JVM that runs out of memory in the middle of a snapshot
+CRASHING_SIMULATION = """
+import sys
+sys.stdout.write("S 0.0\\n0.1 0.2 1.0\\n")
+sys.stdout.flush()
+sys.stderr.write("java.lang.OutOfMemoryError: Java heap space\\n")
+sys.exit(3)
+"""
+
+
+def test_stream_simulation_reports_the_exit_of_a_crashed_simulation(monkeypatch):
+    monkeypatch.setattr(
+        utils,
+        "get_java_command",
+        lambda memory_gigs: [sys.executable, "-c", CRASHING_SIMULATION],
+    )
+    run = {
+        "N": 2,
+        "particle_radius": 0.001,
+        "particle_mass": 1,
+        "domain_type": "circular",
+        "domain_radius": 0.05,
+        "obstacle_radius": 0.005,
+        "speed": 1,
+        "t_max": 1,
+        "repetition": 0,
+    }
+
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        utils.stream_simulation(run, 1, {}, stream_snapshots=True)
+
+    assert error.value.returncode == 3
+    assert "OutOfMemoryError" in error.value.stderr
+    assert isinstance(error.value.__cause__, ValueError)
+
+
+# Stands in for the -batch entry point, the simulations at speed 2 fail
+BATCH_SIMULATION = """
+import sys
+with open(sys.argv[sys.argv.index("-batch") + 1]) as manifest:
+    runs = [line.split() for line in manifest if line.strip()]
+failed = False
+for options in runs:
+    directory = options[options.index("-out") + 1]
+    if options[options.index("-v") + 1] == "2":
+        failed = True
+        sys.stderr.write("Simulation failed: " + directory + ": crash\\n")
+    else:
+        print("Simulation finished: " + directory)
+sys.exit(1 if failed else 0)
+"""
+
+
+def test_simulation_batch_keeps_the_runs_that_finished(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        utils,
+        "get_java_command",
+        lambda memory_gigs: [sys.executable, "-c", BATCH_SIMULATION],
+    )
+    runs = [
+        {
+            "N": 2,
+            "particle_radius": 0.001,
+            "particle_mass": 1,
+            "domain_type": "circular",
+            "domain_radius": 0.05,
+            "obstacle_radius": 0.005,
+            "speed": speed,
+            "t_max": 1,
+            "repetition": 0,
+            "root_dir": str(tmp_path),
+        }
+        for speed in [1, 2, 3]
+    ]
+
+    unique_dirs = utils.execute_simulation_batch(runs, 1)
+
+    assert unique_dirs == [
+        os.path.join(tmp_path, "v-1_it-0"),
+        None,
+        os.path.join(tmp_path, "v-3_it-0"),
+    ]
+
+    # A batch where nothing finished still fails
+    with pytest.raises(subprocess.CalledProcessError):
+        utils.execute_simulation_batch(runs[1:2], 1)
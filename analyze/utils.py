@@ -1,6 +1,14 @@
+import abc
+import contextlib
+import itertools
+import json
 import math
 import os
 import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Mapping
 
 # Load static configuration
 def load_static_data(static_file):
@@ -44,7 +52,30 @@ import numpy as np
 
 
 # Load dynamic data
+# snapshots.txt is a fixed layout: one time line followed by particle_count
+# rows of x y vx vy, so the whole file is one flat run of floats that can be
+# parsed in bulk and reshaped into (snapshot_count, 1 + 4 * particle_count)
 def load_snapshot_data(snapshots_file, particle_count, snapshot_count):
+    with open(snapshots_file, "rb") as file:
+        values = np.fromstring(file.read(), dtype=np.float64, sep=" ")
+
+    block_size = 1 + 4 * particle_count
+    if values.size != snapshot_count * block_size:
+        raise ValueError(
+            f"Expected {snapshot_count * block_size} values in {snapshots_file}, found {values.size}"
+        )
+
+    blocks = values.reshape(snapshot_count, block_size)
+
+    # Splitting the last axis keeps the snapshots a view over the parsed values
+    times = blocks[:, 0].copy()
+    snapshots = blocks[:, 1:].reshape(snapshot_count, particle_count, 4)
+
+    return times, snapshots
+
+
+# Line by line loader, kept as a reference for the bulk loader (see benchmark.py)
+def load_snapshot_data_per_line(snapshots_file, particle_count, snapshot_count):
 
     # Preallocate the 3D array: (num_time_steps, num_particles, 4)
     snapshots = np.zeros((snapshot_count, particle_count, 4), dtype=np.float64)
@@ -69,106 +100,809 @@ def load_snapshot_data(snapshots_file, particle_count, snapshot_count):
     return times, snapshots
 
 
+# Event type codes, as stored in the "type" column of the event table
+WALL_EVENT = 0
+OBSTACLE_EVENT = 1
+PARTICLE_EVENT = 2
+
+EVENT_TYPE_CODES = {b"W": WALL_EVENT, b"O": OBSTACLE_EVENT, b"P": PARTICLE_EVENT}
+
+# Maps each type letter to the digit of its code
+EVENT_TYPE_TABLE = bytes.maketrans(
+    b"".join(EVENT_TYPE_CODES), b"".join(b"%d" % code for code in EVENT_TYPE_CODES.values())
+)
+
+# One row per event. For wall (W) and obstacle (O) events (vx1, vy1) is the
+# velocity after the collision and (vx2, vy2) the velocity before it.
+# For particle (P) events (x, y, vx1, vy1) belongs to the first particle and
+# (x2, y2, vx2, vy2) to other_id, both after the collision.
+EVENT_DTYPE = np.dtype(
+    [
+        ("time", np.float64),
+        ("type", np.int8),
+        ("id", np.int32),
+        ("other_id", np.int32),
+        ("x", np.float64),
+        ("y", np.float64),
+        ("vx1", np.float64),
+        ("vy1", np.float64),
+        ("x2", np.float64),
+        ("y2", np.float64),
+        ("vx2", np.float64),
+        ("vy2", np.float64),
+    ]
+)
+
+
+# Parses events.txt contents into an event table.
+# Every line is a run of numbers except for the type letter, so the letters
+# are translated to their codes and the whole text is parsed as a flat run of
+# floats. Lines have 9 (W, O) or 12 (P) fields, so each row offset into the
+# flat values comes from the number of spaces on the lines before it.
+def parse_event_table(data):
+    if data and not data.endswith(b"\n"):
+        data += b"\n"
+
+    data = data.translate(EVENT_TYPE_TABLE)
+    values = np.fromstring(data, dtype=np.float64, sep=" ")
+
+    raw = np.frombuffer(data, dtype=np.uint8)
+    line_ends = np.flatnonzero(raw == ord("\n"))
+    spaces = np.flatnonzero(raw == ord(" "))
+    spaces_per_line = np.diff(np.searchsorted(spaces, line_ends), prepend=0)
+    fields_per_line = spaces_per_line + 1
+
+    # A padded or missing field would shift every column after it
+    bad_lines = np.flatnonzero((fields_per_line != 9) & (fields_per_line != 12))
+    if len(bad_lines):
+        raise ValueError(
+            f"Line {bad_lines[0] + 1} of the event data has {fields_per_line[bad_lines[0]]} fields, expected 9 or 12"
+        )
+
+    offsets = np.cumsum(fields_per_line) - fields_per_line
+    if values.size != fields_per_line.sum():
+        raise ValueError(f"Expected {fields_per_line.sum()} values, found {values.size}")
+
+    events = np.empty(len(line_ends), dtype=EVENT_DTYPE)
+
+    events["time"] = values[offsets]
+    events["type"] = values[offsets + 1]
+    events["id"] = values[offsets + 2]
+    events["x"] = values[offsets + 3]
+    events["y"] = values[offsets + 4]
+    events["vx1"] = values[offsets + 5]
+    events["vy1"] = values[offsets + 6]
+
+    is_particle_event = events["type"] == PARTICLE_EVENT
+
+    # Only P lines have 12 fields
+    bad_lines = np.flatnonzero(
+        ~np.isin(events["type"], list(EVENT_TYPE_CODES.values()))
+        | (is_particle_event != (fields_per_line == 12))
+    )
+    if len(bad_lines):
+        raise ValueError(
+            f"Line {bad_lines[0] + 1} of the event data has {fields_per_line[bad_lines[0]]} fields for its event type"
+        )
+
+    particle_offsets = offsets[is_particle_event]
+
+    events["other_id"] = -1
+    events["x2"] = events["x"]
+    events["y2"] = events["y"]
+    events["other_id"][is_particle_event] = values[particle_offsets + 7]
+    events["x2"][is_particle_event] = values[particle_offsets + 8]
+    events["y2"][is_particle_event] = values[particle_offsets + 9]
+
+    second_velocity = offsets + np.where(is_particle_event, 10, 7)
+    events["vx2"] = values[second_velocity]
+    events["vy2"] = values[second_velocity + 1]
+
+    return events
+
+
 # Loads events from the events file
-def load_event_data(events_file, event_count):
-    events = np.zeros((event_count, 3), dtype=object)
-    times = np.zeros(event_count, dtype=np.float64)
+def load_event_data(events_file, event_count=None):
+    with open(events_file, "rb") as file:
+        events = parse_event_table(file.read())
 
-    with open(events_file, "r") as file:
-        for i, line in enumerate(file):
-            parts = line.strip().split()
+    if event_count is not None and len(events) != event_count:
+        raise ValueError(
+            f"Expected {event_count} events in {events_file}, found {len(events)}"
+        )
 
-            times[i] = float(parts[0])
+    return events["time"], events
 
-            event_type = parts[1]
-            particle_id = int(parts[2])
-            event_data = list(map(float, parts[3:]))
 
-            events[i] = (event_type, particle_id, event_data)
+# Binary files written with -bin start with this header, followed by
+# little-endian arrays: snapshots.bin holds every snapshot time and then the
+# (snapshot_count, particle_count, 4) states, events.bin one EVENT_DTYPE record
+# per event. "width" is the particle count or the record size respectively
+BINARY_HEADER_DTYPE = np.dtype(
+    [("magic", "S8"), ("version", "<i4"), ("width", "<i4"), ("count", "<i8")]
+)
+BINARY_VERSION = 1
+SNAPSHOTS_MAGIC = b"EDMDSNAP"
+EVENTS_MAGIC = b"EDMDEVNT"
 
 
-    return times, events
+# Returns the width and count of a binary file header
+def load_binary_header(binary_file, magic):
+    header = np.fromfile(binary_file, dtype=BINARY_HEADER_DTYPE, count=1)
 
+    if len(header) != 1 or header["magic"][0] != magic:
+        raise ValueError(f"{binary_file} is not a {magic.decode()} file")
+    if header["version"][0] != BINARY_VERSION:
+        raise ValueError(
+            f"{binary_file} has version {header['version'][0]}, expected {BINARY_VERSION}"
+        )
 
-def get_collisions_with_obstacle(times, events, t_max):
+    return int(header["width"][0]), int(header["count"][0])
 
-    collision_times = {}
 
-    for time, (event_type, particle_id, event_data) in zip(times, events):
-        if event_type == "O" and time <= t_max:
-            x, y, vx1, vy1, vx2, vy2 = event_data
-            collision_times[time] = (particle_id, ((x, y, vx1, vy1, vx2, vy2)))
+# Memory maps snapshots.bin, a snapshot is only read from disk once indexed
+def load_snapshot_data_binary(snapshots_file):
+    particle_count, snapshot_count = load_binary_header(snapshots_file, SNAPSHOTS_MAGIC)
+    offset = BINARY_HEADER_DTYPE.itemsize
 
-    return collision_times
+    times = np.memmap(
+        snapshots_file, dtype="<f8", mode="r", offset=offset, shape=(snapshot_count,)
+    )
+    snapshots = np.memmap(
+        snapshots_file,
+        dtype="<f8",
+        mode="r",
+        offset=offset + times.nbytes,
+        shape=(snapshot_count, particle_count, 4),
+    )
 
+    return times, snapshots
 
-def get_collision_with_wall(times, events, t_max):
-    collision_times = {}
 
-    for time, (event_type, particle_id, event_data) in zip(times, events):
-        if event_type == "W" and time <= t_max:
-            x, y, vx1, vy1, vx2, vy2 = event_data
-            collision_times[time] = (particle_id, ((x, y, vx1, vy1, vx2, vy2)))
+# Memory maps events.bin as an event table
+def load_event_data_binary(events_file):
+    record_size, event_count = load_binary_header(events_file, EVENTS_MAGIC)
+    dtype = EVENT_DTYPE.newbyteorder("<")
+
+    if record_size != dtype.itemsize:
+        raise ValueError(
+            f"{events_file} has {record_size} byte events, expected {dtype.itemsize}"
+        )
+
+    if event_count == 0:
+        events = np.empty(0, dtype=dtype)
+    else:
+        events = np.memmap(
+            events_file,
+            dtype=dtype,
+            mode="r",
+            offset=BINARY_HEADER_DTYPE.itemsize,
+            shape=(event_count,),
+        )
 
-    return collision_times
+    return events["time"], events
 
 
-def get_collision_with_obstacle_count(
-    times, events, t_max
-):
+# Loads the snapshots of a simulation directory, binary if it was written with -bin
+def load_simulation_snapshots(directory, particle_count, snapshot_count):
+    binary_file = os.path.join(directory, "snapshots.bin")
+    if os.path.exists(binary_file):
+        return load_snapshot_data_binary(binary_file)
+
+    return load_snapshot_data(
+        os.path.join(directory, "snapshots.txt"), particle_count, snapshot_count
+    )
+
+
+# Loads the events of a simulation directory, binary if it was written with -bin
+def load_simulation_events(directory, event_count):
+    binary_file = os.path.join(directory, "events.bin")
+    if os.path.exists(binary_file):
+        return load_event_data_binary(binary_file)
+
+    return load_event_data(os.path.join(directory, "events.txt"), event_count)
+
+
+# Trajectory of the tracked particles (-tr), one record per particle at the
+# start and after each of its collisions
+TRAJECTORY_DTYPE = np.dtype(
+    [
+        ("time", np.float64),
+        ("id", np.int32),
+        ("x", np.float64),
+        ("y", np.float64),
+        ("vx", np.float64),
+        ("vy", np.float64),
+    ]
+)
+TRAJECTORY_MAGIC = b"EDMDTRAJ"
 
-    collisions = get_collisions_with_obstacle(
-        times, events, t_max
+
+# Loads trajectory.bin or trajectory.txt of a simulation directory
+def load_trajectory(directory):
+    binary_file = os.path.join(directory, "trajectory.bin")
+
+    if os.path.exists(binary_file):
+        record_size, count = load_binary_header(binary_file, TRAJECTORY_MAGIC)
+        dtype = TRAJECTORY_DTYPE.newbyteorder("<")
+
+        if record_size != dtype.itemsize:
+            raise ValueError(
+                f"{binary_file} has {record_size} byte records, expected {dtype.itemsize}"
+            )
+
+        return np.fromfile(
+            binary_file, dtype=dtype, count=count, offset=BINARY_HEADER_DTYPE.itemsize
+        )
+
+    with open(os.path.join(directory, "trajectory.txt"), "rb") as file:
+        values = np.fromstring(file.read(), dtype=np.float64, sep=" ")
+
+    if values.size % 6:
+        raise ValueError(f"Expected 6 values per trajectory line, found {values.size}")
+
+    values = values.reshape(-1, 6)
+    trajectory = np.empty(len(values), dtype=TRAJECTORY_DTYPE)
+    for i, name in enumerate(TRAJECTORY_DTYPE.names):
+        trajectory[name] = values[:, i]
+
+    return trajectory
+
+
+# Times and (x, y, vx, vy) states of one tracked particle, which moves with MRU
+# between them, so utils.resample_snapshots gives its exact state at any time
+def get_particle_trajectory(trajectory, particle):
+    points = trajectory[trajectory["id"] == particle]
+    states = np.stack([points["x"], points["y"], points["vx"], points["vy"]], axis=1)
+
+    return points["time"], states
+
+
+# Sidecar index of snapshots.txt: a binary header (width is the particle
+# count) followed by the time and byte offset of every snapshot, plus a last
+# record holding the size of the indexed file, used to detect a stale index
+SNAPSHOT_INDEX_MAGIC = b"EDMDSIDX"
+SNAPSHOT_INDEX_DTYPE = np.dtype([("time", "<f8"), ("offset", "<i8")])
+
+# Bytes scanned at a time while indexing
+INDEX_CHUNK_SIZE = 64 * 1024**2
+
+# Longest line of a snapshot row, 4 "%.5f" values of a particle in the domain
+MAX_ROW_BYTES = 128
+
+
+def get_snapshot_index_file(snapshots_file):
+    return snapshots_file + ".idx"
+
+
+# Scans snapshots.txt once for the offset of every time line and writes the
+# sidecar index. Every snapshot has particle_count rows, so the time lines are
+# every particle_count + 1 lines
+def build_snapshot_index(snapshots_file, particle_count):
+    lines_per_snapshot = particle_count + 1
+    offsets = []
+
+    line_count = 0
+    position = 0
+
+    with open(snapshots_file, "rb") as file:
+        while True:
+            chunk = file.read(INDEX_CHUNK_SIZE)
+            if not chunk:
+                break
+
+            # Line starts in the chunk, the first line of the file starts at 0
+            line_starts = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == ord("\n")) + 1
+            if position == 0:
+                line_starts = np.concatenate(([0], line_starts))
+
+            first = (-line_count) % lines_per_snapshot
+            offsets.append(position + line_starts[first::lines_per_snapshot])
+
+            line_count += len(line_starts)
+            position += len(chunk)
+
+        offsets = np.concatenate(offsets) if offsets else np.empty(0, dtype=np.int64)
+
+        # The newline at the end of the file does not start a snapshot
+        offsets = offsets[offsets < position]
+
+        times = []
+        for offset in offsets:
+            file.seek(offset)
+            times.append(float(file.readline()))
+
+    index = np.empty(len(offsets) + 1, dtype=SNAPSHOT_INDEX_DTYPE)
+    index["time"][:-1] = times
+    index["time"][-1] = np.inf
+    index["offset"][:-1] = offsets
+    index["offset"][-1] = position
+
+    header = np.array(
+        [(SNAPSHOT_INDEX_MAGIC, BINARY_VERSION, particle_count, len(offsets))],
+        dtype=BINARY_HEADER_DTYPE,
     )
 
-    collision_count = {}
-    count = 0
+    index_file = get_snapshot_index_file(snapshots_file)
+    with open(index_file + ".tmp", "wb") as file:
+        file.write(header.tobytes())
+        file.write(index.tobytes())
+    os.replace(index_file + ".tmp", index_file)
+
+    return index
+
+
+# Loads the sidecar index of snapshots.txt, building it when it is missing or
+# the file changed since it was indexed
+def load_snapshot_index(snapshots_file, particle_count):
+    index_file = get_snapshot_index_file(snapshots_file)
 
-    for time, _ in collisions.items():
-        count += 1
-        collision_count[time] = count
+    if os.path.exists(index_file):
+        width, count = load_binary_header(index_file, SNAPSHOT_INDEX_MAGIC)
+        index = np.fromfile(
+            index_file, dtype=SNAPSHOT_INDEX_DTYPE, offset=BINARY_HEADER_DTYPE.itemsize
+        )
+
+        if (
+            width == particle_count
+            and len(index) == count + 1
+            and index["offset"][-1] == os.path.getsize(snapshots_file)
+        ):
+            return index
+
+    return build_snapshot_index(snapshots_file, particle_count)
+
+
+# Indices of the indexed snapshots in [t0, t1], every step-th one
+def select_snapshots(index, t0=None, t1=None, step=1):
+    times = index["time"][:-1]
+
+    start = 0 if t0 is None else np.searchsorted(times, t0, side="left")
+    stop = len(times) if t1 is None else np.searchsorted(times, t1, side="right")
+
+    return np.arange(start, stop, step)
+
+
+# Reads the selected snapshots of snapshots.txt, seeking to each of them
+# through the sidecar index
+def read_indexed_snapshots(snapshots_file, particle_count, index, selected):
+    with open(snapshots_file, "rb") as file:
+        if len(selected) and np.all(np.diff(selected) == 1):
+            # A contiguous window is a single read
+            file.seek(index["offset"][selected[0]])
+            data = file.read(index["offset"][selected[-1] + 1] - index["offset"][selected[0]])
+        else:
+            blocks = []
+            for i in selected:
+                file.seek(index["offset"][i])
+                blocks.append(file.read(index["offset"][i + 1] - index["offset"][i]))
+            data = b"".join(blocks)
+
+    values = np.fromstring(data, dtype=np.float64, sep=" ")
+
+    block_size = 1 + 4 * particle_count
+    if values.size != len(selected) * block_size:
+        raise ValueError(
+            f"Expected {len(selected) * block_size} values in {snapshots_file}, found {values.size}"
+        )
 
-    return collision_count
+    blocks = values.reshape(len(selected), block_size)
 
+    return blocks[:, 0].copy(), blocks[:, 1:].reshape(len(selected), particle_count, 4)
 
-def get_first_collision_with_obstacle_count(
-    times, events, t_max
+
+# Loads only the snapshots in [t0, t1], every step-th one
+def load_snapshot_window(snapshots_file, particle_count, t0=None, t1=None, step=1):
+    index = load_snapshot_index(snapshots_file, particle_count)
+    selected = select_snapshots(index, t0, t1, step)
+
+    return read_indexed_snapshots(snapshots_file, particle_count, index, selected)
+
+
+# Snapshots start to stop - 1 of a simulation directory. Only those are read
+# from snapshots.txt, snapshots.bin is memory mapped
+def load_simulation_snapshot_range(directory, particle_count, start, stop):
+    binary_file = os.path.join(directory, "snapshots.bin")
+    if os.path.exists(binary_file):
+        times, snapshots = load_snapshot_data_binary(binary_file)
+        return times[start:stop], snapshots[start:stop]
+
+    snapshots_file = os.path.join(directory, "snapshots.txt")
+    index = load_snapshot_index(snapshots_file, particle_count)
+
+    return read_indexed_snapshots(
+        snapshots_file, particle_count, index, np.arange(start, stop)
+    )
+
+
+# Times of the snapshots of a simulation directory without their states, from
+# the sidecar index of snapshots.txt or the header of snapshots.bin
+def load_simulation_snapshot_times(directory, particle_count):
+    binary_file = os.path.join(directory, "snapshots.bin")
+    if os.path.exists(binary_file):
+        times, _ = load_snapshot_data_binary(binary_file)
+        return np.array(times)
+
+    index = load_snapshot_index(os.path.join(directory, "snapshots.txt"), particle_count)
+    return index["time"][:-1].copy()
+
+
+# Times and states of a single particle in [t0, t1], every step-th snapshot.
+# Only the row of the particle is parsed, the last row (the free obstacle) is
+# read from the end of each snapshot without reading the rest of it
+def load_particle_trajectory(
+    snapshots_file, particle_count, particle, t0=None, t1=None, step=1
+):
+    index = load_snapshot_index(snapshots_file, particle_count)
+    selected = select_snapshots(index, t0, t1, step)
+
+    rows = []
+
+    with open(snapshots_file, "rb") as file:
+        for i in selected:
+            start, end = index["offset"][i], index["offset"][i + 1]
+
+            if particle == particle_count - 1:
+                tail_start = max(start, end - MAX_ROW_BYTES)
+                file.seek(tail_start)
+                row = file.read(end - tail_start).rstrip(b"\n").rsplit(b"\n", 1)[-1]
+            else:
+                file.seek(start)
+                row = file.read(end - start).split(b"\n", particle + 2)[particle + 1]
+
+            rows.append(row)
+
+    states = np.fromstring(b"\n".join(rows), dtype=np.float64, sep=" ")
+    if states.size != len(selected) * 4:
+        raise ValueError(
+            f"Expected {len(selected) * 4} values for particle {particle}, found {states.size}"
+        )
+
+    return index["time"][selected], states.reshape(len(selected), 4)
+
+
+# Events per block yielded by the event block readers
+EVENT_BLOCK_SIZE = 65536
+
+
+# Yields the events of events.txt as event tables of block_size events (the
+# last one may be shorter), holding a single block in memory
+def iter_event_blocks(events_file, block_size=EVENT_BLOCK_SIZE):
+    with open(events_file, "rb") as file:
+        while True:
+            lines = list(itertools.islice(file, block_size))
+            if not lines:
+                return
+
+            yield parse_event_table(b"".join(lines))
+
+
+# Yields the events of events.bin in blocks of block_size events
+def iter_event_blocks_binary(events_file, block_size=EVENT_BLOCK_SIZE):
+    _, events = load_event_data_binary(events_file)
+
+    for start in range(0, len(events), block_size):
+        yield events[start : start + block_size]
+
+
+# Event blocks of a simulation directory, binary if it was written with -bin
+def iter_simulation_event_blocks(directory, block_size=EVENT_BLOCK_SIZE):
+    binary_file = os.path.join(directory, "events.bin")
+    if os.path.exists(binary_file):
+        return iter_event_blocks_binary(binary_file, block_size)
+
+    return iter_event_blocks(os.path.join(directory, "events.txt"), block_size)
+
+
+# Event blocks trimmed to the events up to t_max. Events are not assumed to be
+# sorted by time, so every block is read and masked
+def take_event_blocks_until(event_blocks, t_max):
+    for events in event_blocks:
+        events = events[events["time"] <= t_max]
+        if len(events):
+            yield events
+
+
+# States of the particles at each target time: every particle is advanced with
+# MRU from the last snapshot at or before that time. Exact as long as the
+# particles do not collide between that snapshot and the target time, which
+# always holds when a snapshot is written after every event (skip 1). Target
+# times are processed in batches, so snapshots may be memory mapped
+def resample_snapshots(
+    snapshot_times, snapshots, target_times, particles=None, batch_size=1024
 ):
+    snapshot_times = np.asarray(snapshot_times, dtype=np.float64)
+    target_times = np.asarray(target_times, dtype=np.float64)
+
+    if particles is None:
+        particles = np.arange(snapshots.shape[1])
+    particles = np.asarray(particles)
+
+    indices = np.searchsorted(snapshot_times, target_times, side="right") - 1
+    if len(indices) and indices.min() < 0:
+        raise ValueError(
+            f"Target time {target_times.min()} is before the first snapshot at {snapshot_times[0]}"
+        )
+
+    resampled = np.empty((len(target_times), len(particles), 4))
+
+    for start in range(0, len(target_times), batch_size):
+        batch = slice(start, start + batch_size)
+        batch_indices = indices[batch]
+
+        states = np.asarray(snapshots[batch_indices[:, np.newaxis], particles])
+        dt = target_times[batch] - snapshot_times[batch_indices]
+
+        resampled[batch, :, :2] = (
+            states[:, :, :2] + states[:, :, 2:] * dt[:, np.newaxis, np.newaxis]
+        )
+        resampled[batch, :, 2:] = states[:, :, 2:]
 
-    collisions = get_collisions_with_obstacle(
-        times, events, t_max
+    return resampled
+
+
+# Events between keyframes of a SnapshotReconstructor
+KEYFRAME_INTERVAL = 4096
+
+
+# Reads only the first snapshot of a simulation directory
+def load_initial_snapshot(directory, particle_count):
+    binary_file = os.path.join(directory, "snapshots.bin")
+    if os.path.exists(binary_file):
+        times, snapshots = load_snapshot_data_binary(binary_file)
+        return float(times[0]), np.array(snapshots[0])
+
+    with open(os.path.join(directory, "snapshots.txt"), "rb") as file:
+        time = float(file.readline())
+        rows = b"".join(itertools.islice(file, particle_count))
+
+    snapshot = np.fromstring(rows, dtype=np.float64, sep=" ")
+    if snapshot.size != particle_count * 4:
+        raise ValueError(
+            f"Expected {particle_count * 4} values in the first snapshot, found {snapshot.size}"
+        )
+
+    return time, snapshot.reshape(particle_count, 4)
+
+
+# New state of every particle that collided in the events, in event order: the
+# collision point and the velocity after it, at the event time
+def get_event_updates(events):
+    ids = np.stack([events["id"], events["other_id"]], axis=1).ravel()
+    times = np.repeat(events["time"], 2)
+    states = np.stack(
+        [
+            np.stack([events["x"], events["y"], events["vx1"], events["vy1"]], axis=1),
+            np.stack([events["x2"], events["y2"], events["vx2"], events["vy2"]], axis=1),
+        ],
+        axis=1,
+    ).reshape(-1, 4)
+
+    # Wall and obstacle events only move one particle
+    collided = ids >= 0
+
+    return ids[collided], times[collided], states[collided]
+
+
+# Every particle id in ids and the position of its last update
+def get_last_updates(ids):
+    unique_ids, last_from_end = np.unique(ids[::-1], return_index=True)
+    return unique_ids, len(ids) - 1 - last_from_end
+
+
+# Replays a simulation from its initial snapshot and its event log. Every
+# particle keeps the state it had after its last collision and the time of
+# that collision, between collisions it moves with MRU. The state after every
+# keyframe_interval events is kept, so seeking replays at most that many events
+class SnapshotReconstructor:
+    def __init__(
+        self, initial_time, initial_snapshot, events, keyframe_interval=KEYFRAME_INTERVAL
+    ):
+        self.events = events
+        self.event_times = events["time"]
+        self.keyframe_interval = keyframe_interval
+
+        states = np.array(initial_snapshot, dtype=np.float64)
+        reference_times = np.full(len(states), initial_time, dtype=np.float64)
+
+        keyframe_count = len(events) // keyframe_interval + 1
+        self.keyframe_states = np.empty((keyframe_count,) + states.shape)
+        self.keyframe_times = np.empty((keyframe_count, len(states)))
+
+        self.keyframe_states[0] = states
+        self.keyframe_times[0] = reference_times
+
+        for k in range(1, keyframe_count):
+            start = (k - 1) * keyframe_interval
+            self.apply_events(
+                states, reference_times, events[start : start + keyframe_interval]
+            )
+
+            self.keyframe_states[k] = states
+            self.keyframe_times[k] = reference_times
+
+    # Moves the colliding particles to their state after their last event
+    @staticmethod
+    def apply_events(states, reference_times, events):
+        ids, times, updates = get_event_updates(events)
+        if not len(ids):
+            return
+
+        unique_ids, last = get_last_updates(ids)
+
+        states[unique_ids] = updates[last]
+        reference_times[unique_ids] = times[last]
+
+    # State of every particle at time t, after the events at t
+    def state_at(self, t):
+        event_count = np.searchsorted(self.event_times, t, side="right")
+        k = event_count // self.keyframe_interval
+
+        states = self.keyframe_states[k].copy()
+        reference_times = self.keyframe_times[k].copy()
+
+        self.apply_events(
+            states,
+            reference_times,
+            self.events[k * self.keyframe_interval : event_count],
+        )
+
+        states[:, :2] += states[:, 2:] * (t - reference_times)[:, np.newaxis]
+
+        return states
+
+    def states_at(self, times):
+        return np.array([self.state_at(t) for t in times])
+
+
+# Snapshots of a simulation directory at the given times, rebuilt from its
+# first snapshot and its events, so the simulation can run with a large skip
+def reconstruct_snapshots(
+    directory, particle_count, times, keyframe_interval=KEYFRAME_INTERVAL
+):
+    initial_time, initial_snapshot = load_initial_snapshot(directory, particle_count)
+    _, events = load_simulation_events(directory, None)
+
+    reconstructor = SnapshotReconstructor(
+        initial_time, initial_snapshot, events, keyframe_interval
     )
 
-    collision_count = {}
-    already_collided = set()
-    count = 0
+    return reconstructor.states_at(times)
 
-    for time, (id, _) in collisions.items():
-        if id in already_collided:
-            continue
 
-        count += 1
-        collision_count[time] = count
-        already_collided.add(id)
+def get_collisions_with_obstacle(times, events, t_max):
+    return events[(events["type"] == OBSTACLE_EVENT) & (times <= t_max)]
+
+
+def get_collision_with_wall(times, events, t_max):
+    return events[(events["type"] == WALL_EVENT) & (times <= t_max)]
+
+
+# Cumulative count of obstacle collisions at each collision time
+def get_collision_with_obstacle_count(events, t_max):
+    return accumulate_events(
+        [events], t_max, {"count": CollisionCountAccumulator(OBSTACLE_EVENT)}
+    )["count"]
+
+
+# Count of particles that have collided with the obstacle at least once, at the
+# time of each particle's first collision
+def get_first_collision_with_obstacle_count(events, t_max):
+    return accumulate_events(
+        [events], t_max, {"count": FirstCollisionCountAccumulator(OBSTACLE_EVENT)}
+    )["count"]
+
+
+# Relative kinetic energy change from the first snapshot above which a run is
+# flagged. Snapshots are written with 5 decimals, so exact runs stay far below
+ENERGY_DRIFT_TOLERANCE = 1e-3
+
+
+# Mass of every row of a snapshot, the free obstacle is the last row
+def get_particle_masses(particle_count, particle_mass, obstacle_mass=None):
+    masses = np.full(particle_count, particle_mass, dtype=np.float64)
+
+    if obstacle_mass is not None:
+        masses[-1] = obstacle_mass
+
+    return masses
+
+
+# Kinetic energy, temperature and total momentum of every snapshot, reduced over
+# all (snapshot, particle) velocities at once. All collisions are elastic, so
+# the kinetic energy must be conserved, energy_conserved is False if it drifts
+# more than tolerance relative to the first snapshot. The momentum is not
+# conserved, the walls and a fixed obstacle take part in the collisions.
+def get_energy_diagnostics(
+    particle_data, particle_mass, obstacle_mass=None, tolerance=ENERGY_DRIFT_TOLERANCE
+):
+    particle_count = particle_data.shape[1]
+    masses = get_particle_masses(particle_count, particle_mass, obstacle_mass)
+    velocities = particle_data[:, :, 2:]
+
+    kinetic_energies = 0.5 * np.einsum("snk,snk,n->s", velocities, velocities, masses)
+    momentums = np.einsum("snk,n->sk", velocities, masses)
+
+    energy_drifts = np.abs(kinetic_energies - kinetic_energies[0])
+    if kinetic_energies[0] > 0:
+        energy_drifts /= kinetic_energies[0]
+
+    max_energy_drift = float(energy_drifts.max())
+
+    return {
+        "kinetic_energies": kinetic_energies,
+        "temperatures": kinetic_energies / particle_count,
+        "momentums": momentums,
+        "energy_drifts": energy_drifts,
+        "max_energy_drift": max_energy_drift,
+        "energy_conserved": max_energy_drift <= tolerance,
+    }
+
+
+# The initial snapshot with the velocities of the particles that collided
+# replaced by their last ones (see LastVelocityAccumulator). Only the velocities
+# are final, the positions are left as they were
+def apply_last_velocities(initial_snapshot, last_velocities):
+    ids, velocities = last_velocities
+
+    snapshot = np.array(initial_snapshot, dtype=np.float64)
+    snapshot[ids, 2:] = velocities
 
-    return collision_count
+    return snapshot
 
 
-def get_system_temperature(particle_data, particle_mass):
+def get_system_temperature(particle_data, particle_mass, obstacle_mass=None):
 
     # All collisions are elastic, so the energy is conserved
-    velocities = particle_data[0]
-    particle_count = len(velocities)
+    diagnostics = get_energy_diagnostics(
+        particle_data[:1], particle_mass, obstacle_mass
+    )
 
-    kinetic_energy = 0
+    return float(diagnostics["temperatures"][0])
 
-    for _, _, vx, vy in velocities:
-        kinetic_energy += 0.5 * particle_mass * (vx**2 + vy**2)
 
-    return kinetic_energy / particle_count
+# Runs a command like subprocess.run(check=True). If usage is given it is filled
+# with the wall time in seconds and the peak resident memory in gigabytes
+def run_process(command, usage=None, stdout=subprocess.DEVNULL):
+    start = time.perf_counter()
 
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(command, stdout=stdout, stderr=stderr_file)
 
-def execute_simulation(
+        wait_process(process, command, start, stderr_file, usage)
+
+
+# Waits for a process started at start with its stderr on stderr_file, fills
+# usage and raises CalledProcessError like run_process
+def wait_process(process, command, start, stderr_file, usage=None):
+
+    # wait4 reports the resources of this child only, even with others running
+    if hasattr(os, "wait4"):
+        _, status, resources = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        rss_unit = 1 if sys.platform == "darwin" else 1024
+        peak_rss_gigs = resources.ru_maxrss * rss_unit / 1024**3
+    else:
+        process.wait()
+        peak_rss_gigs = None
+
+    if usage is not None:
+        usage["wall_time"] = time.perf_counter() - start
+        usage["peak_rss_gigs"] = peak_rss_gigs
+
+    if process.returncode != 0:
+        stderr_file.seek(0)
+        raise subprocess.CalledProcessError(
+            process.returncode,
+            command,
+            stderr=stderr_file.read().decode(errors="replace"),
+        )
+
+
+# Output directory and command line options of one simulation
+def get_simulation_arguments(
     N,
     particle_radius,
     particle_mass,
@@ -178,32 +912,25 @@ def execute_simulation(
     speed,
     t_max,
     repetition,
-    memory_gigs,
     root_dir="data",
     obstacle="fixed",
     om=3,
     skip=100000000,
+    binary_output=False,
+    seed=None,
+    track=None,
+    stream=None,
 ):
 
     # Create a unique directory based on the parameters
     name = f"v-{speed}_it-{repetition}"
     unique_dir = os.path.join(root_dir, name)
 
-    os.makedirs(unique_dir, exist_ok=True)
-
-    # Build the command
-    command = [
-        "java",
-        f"-Xmx{memory_gigs}G",  # Maximum heap size
-        f"-Xms{memory_gigs}G",  # Initial heap size
-        "-jar",
-        "target/event-driven-molecular-dynamics-1.0-SNAPSHOT-jar-with-dependencies.jar",
+    arguments = [
         "-obs",
         str(obstacle),
         "-om",
         str(om),
-        "-out",
-        unique_dir,
         "-N",
         str(N),
         "-r",
@@ -224,9 +951,88 @@ def execute_simulation(
         str(skip)
     ]
 
+    # A streamed simulation writes "events" or "snapshots" (and events) to
+    # stdout instead of an output directory
+    if stream is None:
+        arguments.extend(["-out", unique_dir])
+    else:
+        arguments.extend(["-st", stream])
+        unique_dir = None
+
+    if binary_output:
+        arguments.append("-bin")
+
+    if seed is not None:
+        arguments.extend(["-s", str(seed)])
+
+    # True tracks the free obstacle, a list tracks those particle ids
+    if track is True:
+        arguments.append("-tr")
+    elif track:
+        arguments.extend(["-tr", ",".join(str(id) for id in track)])
+
+    return unique_dir, arguments
+
+
+def get_java_command(memory_gigs):
+    return [
+        "java",
+        # Maximum heap size only, so the heap and the RSS grow with what the
+        # run needs instead of starting at the estimate
+        f"-Xmx{int(memory_gigs * 1024)}M",
+        "-jar",
+        "target/event-driven-molecular-dynamics-1.0-SNAPSHOT-jar-with-dependencies.jar",
+    ]
+
+
+def execute_simulation(
+    N,
+    particle_radius,
+    particle_mass,
+    domain_type,
+    domain_radius,
+    obstacle_radius,
+    speed,
+    t_max,
+    repetition,
+    memory_gigs,
+    root_dir="data",
+    obstacle="fixed",
+    om=3,
+    skip=100000000,
+    binary_output=False,
+    usage=None,
+    seed=None,
+    track=None,
+):
+
+    unique_dir, arguments = get_simulation_arguments(
+        N,
+        particle_radius,
+        particle_mass,
+        domain_type,
+        domain_radius,
+        obstacle_radius,
+        speed,
+        t_max,
+        repetition,
+        root_dir,
+        obstacle,
+        om,
+        skip,
+        binary_output,
+        seed,
+        track,
+    )
+
+    os.makedirs(unique_dir, exist_ok=True)
+
+    # Build the command
+    command = get_java_command(memory_gigs) + arguments
+
     try:
         print(f"Running simulation with speed {speed}, repetition {repetition}")
-        subprocess.run(command, check=True, capture_output=True, text=True)
+        run_process(command, usage)
         print(
             f"Simulation completed successfully for speed {speed}, repetition {repetition}"
         )
@@ -237,46 +1043,517 @@ def execute_simulation(
 
     return unique_dir
 
-def get_system_pressure(times, events, domain_radius, obstacle_radius, time_slot_duration, particle_mass, t_max):
-    collisions_obstacle = get_collisions_with_obstacle(times, events, t_max)
-    collisions_wall = get_collision_with_wall(times, events, t_max)
 
-    obstacle_momentums = [0]
-    wall_momentums = [0]
+# Simulations per JVM: enough to amortize its startup and JIT warm up, few
+# enough that a failed batch only loses a handful of runs
+DEFAULT_BATCH_SIZE = 8
+
+
+# Line the -batch entry point prints for every simulation that finished
+BATCH_FINISHED_PREFIX = "Simulation finished: "
+
+
+# Runs several simulations in one JVM with the -batch entry point, threads of
+# them at a time. runs are dicts with the keyword arguments of
+# get_simulation_arguments, and memory_gigs is the heap shared by all of them.
+# Returns their output directories in order, None for the runs that failed.
+# Raises CalledProcessError only if none of them finished.
+def execute_simulation_batch(runs, memory_gigs, threads=None, usage=None):
+    unique_dirs = []
+    lines = []
+
+    for run in runs:
+        unique_dir, arguments = get_simulation_arguments(**run)
+
+        # The manifest splits the options of a run on whitespace
+        if any(not argument or argument.split() != [argument] for argument in arguments):
+            raise ValueError(f"Batched simulation options can not have spaces: {arguments}")
+
+        os.makedirs(unique_dir, exist_ok=True)
+        unique_dirs.append(unique_dir)
+        lines.append(" ".join(arguments))
+
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as manifest:
+        manifest.write("\n".join(lines) + "\n")
+
+    command = get_java_command(memory_gigs) + ["-batch", manifest.name]
+    if threads is not None:
+        command.extend(["-th", str(threads)])
+
+    with tempfile.TemporaryFile() as stdout_file:
+        try:
+            print(f"Running a batch of {len(runs)} simulations")
+            run_process(command, usage, stdout=stdout_file)
+            print(f"Batch of {len(runs)} simulations completed successfully")
+            return unique_dirs
+        except subprocess.CalledProcessError as e:
+            error = e
+        finally:
+            os.remove(manifest.name)
+
+        stdout_file.seek(0)
+        finished = {
+            line[len(BATCH_FINISHED_PREFIX) :].strip()
+            for line in stdout_file.read().decode(errors="replace").splitlines()
+            if line.startswith(BATCH_FINISHED_PREFIX)
+        }
+
+    print(f"{len(runs) - len(finished)} of {len(runs)} batched simulations failed")
+    print(f"Error Output: {error.stderr}")
+
+    if not finished:
+        raise error
+
+    return [unique_dir if unique_dir in finished else None for unique_dir in unique_dirs]
+
+
+# Groups the positions of runs into batches of batch_size, largest runs first
+# so the runs that share a JVM have similar sizes and the heap sized for the
+# largest one is not wasted on the others
+def get_simulation_batches(runs, batch_size=DEFAULT_BATCH_SIZE):
+    order = sorted(
+        range(len(runs)),
+        key=lambda i: runs[i]["N"] * runs[i]["speed"] * runs[i]["t_max"],
+        reverse=True,
+    )
+    return [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+# Flattens a result into "prefix/key" arrays. The parameters dict holds mixed
+# types, so it is kept as JSON metadata
+def flatten_result(result, prefix, arrays):
+    for key, value in result.items():
+        name = f"{prefix}/{key}"
+
+        if key == "parameters":
+            arrays[name] = np.array(json.dumps(dict(value)))
+        elif isinstance(value, Mapping):
+            flatten_result(value, name, arrays)
+        else:
+            arrays[name] = np.asarray(value)
+
+
+# Saves a list of results to a compressed .npz, one run-<index> group per result
+def save_results(results, results_file):
+    arrays = {}
+    for i, result in enumerate(results):
+        flatten_result(result, f"run-{i:04d}", arrays)
+
+    np.savez_compressed(results_file, **arrays)
+
+
+# Value of a flattened array, the parameters are JSON and scalars come back as
+# plain numbers
+def get_result_value(key, value):
+    if key == "parameters":
+        return json.loads(value.item())
+
+    return value.item() if value.ndim == 0 else value
+
+
+# Nested {group: {key: array name}} of the "prefix/key" names of flatten_result
+def get_result_tree(names):
+    tree = {}
+
+    for name in names:
+        *groups, key = name.split("/")
+
+        group = tree
+        for group_name in groups:
+            group = group.setdefault(group_name, {})
+
+        group[key] = name
+
+    return tree
+
 
-    # Calculate the momentum of the particles that collide with the obstacle, dividing them into groups of time_slot_duration
-    current_time_slot = 0
-    for time, (_, ((x, y, vx1, vy1, _, _))) in collisions_obstacle.items():
-        if time > current_time_slot * time_slot_duration:
-            obstacle_momentums[current_time_slot] /= time_slot_duration * 2 * math.pi * obstacle_radius
-            current_time_slot += 1
-            obstacle_momentums.append(0)
+# Read only view of a result of an open .npz. Every array is read from the
+# file when it is accessed and not kept, so a figure only loads what it uses
+class LazyResult(Mapping):
+    def __init__(self, npz, tree):
+        self.npz = npz
+        self.tree = tree
 
-        # get normal component
-        normal = (x / math.sqrt(x ** 2 + y ** 2), y / math.sqrt(x ** 2 + y ** 2))
+    def __getitem__(self, key):
+        entry = self.tree[key]
 
-        v1_normal = abs(vx1 * normal[0] + vy1 * normal[1])
+        if isinstance(entry, dict):
+            return LazyResult(self.npz, entry)
 
-        obstacle_momentums[current_time_slot] += 2 * v1_normal * particle_mass
+        return get_result_value(key, self.npz[entry])
 
-    obstacle_momentums[current_time_slot] /= time_slot_duration * 2 * math.pi * obstacle_radius
+    def __iter__(self):
+        return iter(self.tree)
 
-    # Calculate the momentum of the particles that collide with the wall, dividing them into groups of time_slot_duration
-    current_time_slot = 0
-    for time, (_, ((x, y, vx1, vy1, _, _))) in collisions_wall.items():
-        if time > current_time_slot * time_slot_duration:
-            wall_momentums[current_time_slot] /= time_slot_duration * 2 * math.pi * domain_radius
-            current_time_slot += 1
-            wall_momentums.append(0)
+    def __len__(self):
+        return len(self.tree)
 
-        # get normal component
-        normal = (x / math.sqrt(x ** 2 + y ** 2), y / math.sqrt(x ** 2 + y ** 2))
 
-        v1_normal = abs(vx1 * normal[0] + vy1 * normal[1])
+# The results saved with save_results, in the same order, as LazyResult views.
+# The file is closed when the with block exits, arrays read before stay valid
+@contextlib.contextmanager
+def open_results(results_file):
+    with np.load(results_file) as npz:
+        runs = get_result_tree(npz.files)
+        yield [LazyResult(npz, runs[run]) for run in sorted(runs)]
 
-        wall_momentums[current_time_slot] += 2 * v1_normal * particle_mass
 
-    wall_momentums[current_time_slot] /= time_slot_duration * 2 * math.pi * domain_radius
+def copy_result(result):
+    return {
+        key: copy_result(value) if isinstance(value, LazyResult) else value
+        for key, value in result.items()
+    }
+
+
+# Reads every array of the results saved with save_results, for small files
+# like the cached analyses. The file is closed on return
+def load_results(results_file):
+    with open_results(results_file) as results:
+        return [copy_result(result) for result in results]
+
+
+# Number of time slots of time_slot_duration needed to cover [0, t_max]
+def get_time_slot_count(t_max, time_slot_duration):
+    return max(int(np.ceil(round(t_max / time_slot_duration, 9))), 1)
+
+
+# Adds the momentum transferred by the collisions to the time slot of each
+# one, slot k holding the collisions in [k, k + 1) * time_slot_duration. The
+# normal of each collision is the direction of the collision point from the
+# origin. Momentums are added one collision at a time in order, so the sums do
+# not depend on how the events are split in blocks
+def add_slot_momentums(slot_momentums, collisions, time_slot_duration, particle_mass):
+    slot_count = len(slot_momentums)
+
+    slots = (collisions["time"] // time_slot_duration).astype(np.int64)
+    slots = np.clip(slots, 0, slot_count - 1)
+
+    x, y = collisions["x"], collisions["y"]
+    v_normal = np.abs(collisions["vx1"] * x + collisions["vy1"] * y) / np.hypot(x, y)
+
+    np.add.at(slot_momentums, slots, 2 * v_normal * particle_mass)
+
+
+# Momentum transferred by the collisions in each time slot
+def get_slot_momentums(collisions, time_slot_duration, slot_count, particle_mass):
+    slot_momentums = np.zeros(slot_count)
+    add_slot_momentums(slot_momentums, collisions, time_slot_duration, particle_mass)
+
+    return slot_momentums
+
+
+# Pressure on the obstacle and on the wall for every time slot up to t_max,
+# empty slots included
+def get_system_pressure(
+    events, domain_radius, obstacle_radius, time_slot_duration, particle_mass, t_max
+):
+    pressures = accumulate_events(
+        [events],
+        t_max,
+        {
+            "obstacle": SlotPressureAccumulator(
+                OBSTACLE_EVENT, obstacle_radius, time_slot_duration, particle_mass, t_max
+            ),
+            "wall": SlotPressureAccumulator(
+                WALL_EVENT, domain_radius, time_slot_duration, particle_mass, t_max
+            ),
+        },
+    )
+
+    return pressures["obstacle"], pressures["wall"]
+
+
+# Metrics computed in a single pass over the events. Every accumulator is fed
+# each block of events in time order through add, and result returns its
+# metric once every block was added. New metrics only need a new accumulator.
+class EventAccumulator(abc.ABC):
+    @abc.abstractmethod
+    def add(self, events):
+        pass
+
+    @abc.abstractmethod
+    def result(self):
+        pass
+
+
+# Collisions of event_type per unit of time, up to the last one
+class CollisionFrequencyAccumulator(EventAccumulator):
+    def __init__(self, event_type):
+        self.event_type = event_type
+        self.count = 0
+        self.last_time = 0.0
+
+    def add(self, events):
+        collision_times = events["time"][events["type"] == self.event_type]
+
+        if len(collision_times):
+            self.count += len(collision_times)
+            self.last_time = max(self.last_time, collision_times.max())
+
+    def result(self):
+        return self.count / self.last_time if self.count else 0.0
+
+
+# Cumulative count of collisions of event_type at each collision time
+class CollisionCountAccumulator(EventAccumulator):
+    def __init__(self, event_type):
+        self.event_type = event_type
+        self.collision_times = []
+
+    def add(self, events):
+        self.collision_times.append(events["time"][events["type"] == self.event_type])
+
+    def result(self):
+        collision_times = (
+            np.concatenate(self.collision_times) if self.collision_times else np.empty(0)
+        )
+
+        return collision_times, np.arange(1, len(collision_times) + 1)
+
+
+# Count of particles that had a collision of event_type, at the time of each
+# particle's first one
+class FirstCollisionCountAccumulator(EventAccumulator):
+    def __init__(self, event_type):
+        self.event_type = event_type
+        self.collided = np.zeros(0, dtype=bool)
+        self.collision_times = []
+
+    def add(self, events):
+        collisions = events[events["type"] == self.event_type]
+        if not len(collisions):
+            return
+
+        ids = collisions["id"]
+        if ids.max() >= len(self.collided):
+            self.collided = np.concatenate(
+                [self.collided, np.zeros(ids.max() + 1 - len(self.collided), dtype=bool)]
+            )
+
+        # Index of the first collision in the block of each particle that had
+        # not collided yet, back in time order
+        unique_ids, first_collisions = np.unique(ids, return_index=True)
+        first_collisions = np.sort(first_collisions[~self.collided[unique_ids]])
+
+        self.collided[unique_ids] = True
+        self.collision_times.append(collisions["time"][first_collisions])
+
+    def result(self):
+        collision_times = (
+            np.concatenate(self.collision_times) if self.collision_times else np.empty(0)
+        )
+
+        return collision_times, np.arange(1, len(collision_times) + 1)
+
+
+# Pressure of the collisions of event_type on a circle of the given radius,
+# for every time slot up to t_max
+class SlotPressureAccumulator(EventAccumulator):
+    def __init__(self, event_type, radius, time_slot_duration, particle_mass, t_max):
+        self.event_type = event_type
+        self.radius = radius
+        self.time_slot_duration = time_slot_duration
+        self.particle_mass = particle_mass
+        self.slot_momentums = np.zeros(get_time_slot_count(t_max, time_slot_duration))
+
+    def add(self, events):
+        add_slot_momentums(
+            self.slot_momentums,
+            events[events["type"] == self.event_type],
+            self.time_slot_duration,
+            self.particle_mass,
+        )
+
+    def result(self):
+        return self.slot_momentums / (
+            self.time_slot_duration * 2 * math.pi * self.radius
+        )
+
+
+# Velocity of every particle after its last event, the ids of the particles
+# that collided and their velocities. With the first snapshot it gives the
+# kinetic energy at t_max without rebuilding the positions
+class LastVelocityAccumulator(EventAccumulator):
+    def __init__(self):
+        self.collided = np.zeros(0, dtype=bool)
+        self.velocities = np.zeros((0, 2))
+
+    def add(self, events):
+        ids, _, states = get_event_updates(events)
+        if not len(ids):
+            return
+
+        if ids.max() >= len(self.collided):
+            extra = ids.max() + 1 - len(self.collided)
+            self.collided = np.concatenate([self.collided, np.zeros(extra, dtype=bool)])
+            self.velocities = np.concatenate([self.velocities, np.zeros((extra, 2))])
+
+        unique_ids, last = get_last_updates(ids)
+
+        self.collided[unique_ids] = True
+        self.velocities[unique_ids] = states[last, 2:]
+
+    def result(self):
+        return np.flatnonzero(self.collided), self.velocities[self.collided]
+
+
+# Feeds every event up to t_max to the accumulators in one pass, returns the
+# result of each accumulator under the same key
+def accumulate_events(event_blocks, t_max, accumulators):
+    for events in take_event_blocks_until(event_blocks, t_max):
+        for accumulator in accumulators.values():
+            accumulator.add(events)
+
+    return {name: accumulator.result() for name, accumulator in accumulators.items()}
+
+
+# Streamed output (-st): the events.txt lines of the events as they happen and,
+# for every snapshot, this header line followed by the snapshots.txt rows
+STREAM_SNAPSHOT_PREFIX = b"S "
+
+# Bytes buffered from the pipe of a streamed simulation
+STREAM_BUFFER_SIZE = 1024**2
+
+# Seconds a streamed simulation gets to exit after its output fails to parse,
+# before it is killed
+STREAM_EXIT_TIMEOUT = 5
+
+
+# Parses a streamed simulation as it arrives. Yields blocks of up to block_size
+# events like iter_event_blocks, and appends the (time, states) of every
+# streamed snapshot to snapshots if given
+def iter_stream_event_blocks(
+    stream, particle_count, snapshots=None, block_size=EVENT_BLOCK_SIZE
+):
+    lines = []
+
+    for line in stream:
+        if line.startswith(STREAM_SNAPSHOT_PREFIX):
+            rows = b"".join(itertools.islice(stream, particle_count))
+            states = np.fromstring(rows, dtype=np.float64, sep=" ")
+
+            if states.size != 4 * particle_count:
+                raise ValueError(
+                    f"Expected {4 * particle_count} values in the snapshot at {line[2:].strip()}, found {states.size}"
+                )
+
+            if snapshots is not None:
+                snapshots.append((float(line[2:]), states.reshape(particle_count, 4)))
+            continue
+
+        lines.append(line)
+
+        if len(lines) == block_size:
+            yield parse_event_table(b"".join(lines))
+            lines = []
+
+    if lines:
+        yield parse_event_table(b"".join(lines))
+
+
+# What load_static_data reads from static.txt, for a simulation that has none
+def get_run_static_data(run, snapshot_count, event_count):
+    is_obstacle_free = run.get("obstacle", "fixed") == "free"
+    particle_count = run["N"] + (1 if is_obstacle_free else 0)
+
+    return {
+        "particle_count": particle_count,
+        "particle_radius": float(run["particle_radius"]),
+        "particle_mass": float(run["particle_mass"]),
+        "initial_velocity": float(run["speed"]),
+        "domain_type": run["domain_type"],
+        "domain_radius": float(run["domain_radius"]),
+        "obstacle_type": "free" if is_obstacle_free else "obstacle",
+        "obstacle_radius": float(run["obstacle_radius"]),
+        "obstacle_mass": float(run.get("om", 3)) if is_obstacle_free else None,
+        "snapshot_count": snapshot_count,
+        "event_count": event_count,
+    }
+
+
+# Runs a simulation with its output streamed over a pipe into the accumulators
+# (see accumulate_events), so nothing is written to disk and the analysis runs
+# alongside the simulation. run holds the keyword arguments of
+# get_simulation_arguments. Returns the static data of the run, the times and
+# states of the streamed snapshots and the results of the accumulators.
+def stream_simulation(
+    run, memory_gigs, accumulators, stream_snapshots=False, usage=None
+):
+    run = {**run, "stream": "snapshots" if stream_snapshots else "events"}
+    _, arguments = get_simulation_arguments(**run)
+
+    particle_count = run["N"] + (1 if run.get("obstacle", "fixed") == "free" else 0)
+    command = get_java_command(memory_gigs) + arguments
+
+    snapshots = []
+    event_count = 0
+
+    def count_events(event_blocks):
+        nonlocal event_count
+        for events in event_blocks:
+            event_count += len(events)
+            yield events
+
+    print(f"Streaming simulation with speed {run['speed']}, repetition {run['repetition']}")
+
+    start = time.perf_counter()
+
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+            bufsize=STREAM_BUFFER_SIZE,
+        )
 
-    return obstacle_momentums, wall_momentums
-    
+        try:
+            event_blocks = count_events(
+                iter_stream_event_blocks(process.stdout, particle_count, snapshots)
+            )
+            metrics = accumulate_events(event_blocks, run["t_max"], accumulators)
+        except ValueError as parse_error:
+            # A truncated record usually means the simulation died mid stream
+            # (out of memory, crash), its exit code and stderr tell why
+            try:
+                process.wait(timeout=STREAM_EXIT_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+                raise parse_error
+
+            if process.returncode == 0:
+                raise
+
+            stderr_file.seek(0)
+            e = subprocess.CalledProcessError(
+                process.returncode,
+                command,
+                stderr=stderr_file.read().decode(errors="replace"),
+            )
+            print(f"Simulation failed for speed {run['speed']}, repetition {run['repetition']}")
+            print(f"Error Output: {e.stderr}")
+            raise e from parse_error
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        finally:
+            process.stdout.close()
+
+        try:
+            wait_process(process, command, start, stderr_file, usage)
+        except subprocess.CalledProcessError as e:
+            print(f"Simulation failed for speed {run['speed']}, repetition {run['repetition']}")
+            print(f"Error Output: {e.stderr}")
+            raise e
+
+    if snapshots:
+        snapshot_times = np.array([snapshot_time for snapshot_time, _ in snapshots])
+        snapshot_states = np.stack([states for _, states in snapshots])
+    else:
+        snapshot_times = np.empty(0)
+        snapshot_states = np.empty((0, particle_count, 4))
+
+    parameters = get_run_static_data(run, len(snapshots), event_count)
+
+    return parameters, snapshot_times, snapshot_states, metrics
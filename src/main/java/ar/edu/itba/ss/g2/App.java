@@ -1,6 +1,8 @@
 package ar.edu.itba.ss.g2;
 
 import ar.edu.itba.ss.g2.config.ArgParser;
+import ar.edu.itba.ss.g2.config.BatchArgParser;
+import ar.edu.itba.ss.g2.config.BatchConfiguration;
 import ar.edu.itba.ss.g2.config.Configuration;
 import ar.edu.itba.ss.g2.generation.CircleParticleGenerator;
 import ar.edu.itba.ss.g2.generation.ParticleGenerator;
@@ -9,15 +11,29 @@ import ar.edu.itba.ss.g2.model.Output;
 import ar.edu.itba.ss.g2.model.Particle;
 import ar.edu.itba.ss.g2.simulation.Simulation;
 import ar.edu.itba.ss.g2.utils.FileUtil;
+import ar.edu.itba.ss.g2.utils.OutputStreamer;
 
 import java.io.IOException;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.io.UncheckedIOException;
+import java.util.ArrayList;
 import java.util.HashSet;
 import java.util.List;
 import java.util.Random;
+import java.util.concurrent.ExecutionException;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
+import java.util.concurrent.Future;
 
 public class App {
     public static void main(String[] args) {
 
+        if (BatchArgParser.isBatch(args)) {
+            runBatch(args);
+            return;
+        }
+
         ArgParser parser = new ArgParser(args);
         Configuration configuration = parser.parse();
 
@@ -26,6 +42,82 @@ public class App {
             System.exit(1);
         }
 
+        // stdout carries the streamed output
+        PrintStream log = configuration.isStreamOutput() ? System.err : System.out;
+
+        try {
+            run(configuration, log);
+        } catch (IllegalStateException | UncheckedIOException e) {
+            System.err.println(e.getMessage());
+            System.exit(1);
+        } catch (IOException e) {
+            System.err.println("Error writing output file: " + e.getMessage());
+            System.exit(1);
+        }
+    }
+
+    // Runs every simulation of a manifest in this JVM, so they share its startup
+    // and warmed up JIT. Exits with an error if any of them failed.
+    private static void runBatch(String[] args) {
+
+        BatchArgParser parser = new BatchArgParser(args);
+        BatchConfiguration batch = parser.parse();
+
+        if (batch == null) {
+            parser.printHelp();
+            System.exit(1);
+        }
+
+        List<Configuration> configurations = batch.configurations();
+        int threadCount = Math.min(batch.threadCount(), configurations.size());
+
+        System.out.println(
+                "Running " + configurations.size() + " simulations on " + threadCount + " threads...");
+
+        // The progress messages of concurrent runs would interleave
+        PrintStream log = new PrintStream(OutputStream.nullOutputStream());
+
+        ExecutorService executor = Executors.newFixedThreadPool(threadCount);
+        List<Future<?>> futures = new ArrayList<>();
+
+        for (Configuration configuration : configurations) {
+            futures.add(
+                    executor.submit(
+                            () -> {
+                                run(configuration, log);
+                                return null;
+                            }));
+        }
+
+        executor.shutdown();
+
+        int failures = 0;
+
+        for (int i = 0; i < futures.size(); i++) {
+            String outputDirectory = configurations.get(i).getOutputDirectory();
+
+            try {
+                futures.get(i).get();
+                System.out.println("Simulation finished: " + outputDirectory);
+            } catch (ExecutionException e) {
+                failures++;
+                System.err.println(
+                        "Simulation failed: " + outputDirectory + ": " + e.getCause());
+            } catch (InterruptedException e) {
+                Thread.currentThread().interrupt();
+                System.exit(1);
+            }
+        }
+
+        if (failures > 0) {
+            System.err.println(failures + " of " + futures.size() + " simulations failed");
+            System.exit(1);
+        }
+    }
+
+    // Generates the particles, runs the simulation and writes its output
+    private static void run(Configuration configuration, PrintStream log) throws IOException {
+
         // Generate particles
         int particleCount = configuration.getParticleCount();
         double particleRadius = configuration.getParticleRadius();
@@ -60,16 +152,8 @@ public class App {
                             random);
         }
 
-        List<Particle> particles;
-
-        try {
-            System.out.println("Generating particles...");
-            particles = generator.generate();
-        } catch (IllegalStateException e) {
-            System.err.println(e.getMessage());
-            System.exit(1);
-            return;
-        }
+        log.println("Generating particles...");
+        List<Particle> particles = generator.generate();
 
         double domainSize =
                 configuration.isDomainCircular()
@@ -109,20 +193,35 @@ public class App {
                             obstacleRadius);
         }
 
-        System.out.println("Running simulation...");
+        if (configuration.isTrajectoryOutput()) {
+            simulation.trackParticles(configuration.getTrackedParticleIds());
+        }
 
-        simulation.run(maxTime, skipEvents);
+        if (configuration.isStreamOutput()) {
+            log.println("Running simulation, streaming output...");
 
-        System.out.println("Simulation finished, writing output...");
+            try (OutputStreamer streamer =
+                    new OutputStreamer(configuration.isStreamSnapshots())) {
+                simulation.streamTo(streamer);
+                simulation.run(maxTime, skipEvents);
+            }
 
+            return;
+        }
 
-        Output output = new Output(simulation.getSnapshots(), simulation.getEvents(), configuration);
+        log.println("Running simulation...");
 
-        try {
-            FileUtil.serializeOutput(output, configuration.getOutputDirectory());
-        } catch (IOException e) {
-            System.err.println("Error writing output file: " + e.getMessage());
-            System.exit(1);
-        }
+        simulation.run(maxTime, skipEvents);
+
+        log.println("Simulation finished, writing output...");
+
+        Output output =
+                new Output(
+                        simulation.getSnapshots(),
+                        simulation.getEvents(),
+                        simulation.getTrajectory(),
+                        configuration);
+
+        FileUtil.serializeOutput(output, configuration.getOutputDirectory());
     }
 }
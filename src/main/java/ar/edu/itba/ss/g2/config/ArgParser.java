@@ -2,6 +2,7 @@ package ar.edu.itba.ss.g2.config;
 
 import org.apache.commons.cli.*;
 
+import java.util.ArrayList;
 import java.util.Comparator;
 import java.util.List;
 
@@ -11,6 +12,23 @@ public class ArgParser {
             List.of(
                     new Option("h", "help", false, "Print this message"),
                     new Option("out", "output", true, "Output directory"),
+                    new Option("bin", "binary", false, "Write snapshots and events as binary files"),
+                    Option.builder("tr")
+                            .longOpt("track")
+                            .hasArg()
+                            .optionalArg(true)
+                            .desc(
+                                    "Write the trajectory of these comma separated particle ids,"
+                                            + " the free obstacle if none are given")
+                            .build(),
+                    Option.builder("st")
+                            .longOpt("stream")
+                            .hasArg()
+                            .optionalArg(true)
+                            .desc(
+                                    "Write the events to stdout as they happen instead of the output"
+                                            + " directory, and the snapshots too with \"snapshots\"")
+                            .build(),
 
                     // Simulation domain
                     new Option("d", "domain", true, "Domain type square|circular"),
@@ -62,14 +80,34 @@ public class ArgParser {
 
         Configuration.Builder builder = new Configuration.Builder();
 
+        // Stream output, which needs no output directory
+        if (cmd.hasOption("st")) {
+
+            String stream = cmd.getOptionValue("st");
+
+            if (stream != null && !stream.equals("events") && !stream.equals("snapshots")) {
+                System.err.println("Invalid stream output: " + stream);
+                return null;
+            }
+
+            if (cmd.hasOption("bin") || cmd.hasOption("tr")) {
+                System.err.println("Stream output can not be binary or have a trajectory");
+                return null;
+            }
+
+            builder.streamOutput("snapshots".equals(stream));
+        }
+
         // Output directory
         if (cmd.hasOption("out")) {
             builder.outputDirectory(cmd.getOptionValue("out"));
-        } else {
+        } else if (!cmd.hasOption("st")) {
             System.err.println("Output directory is required");
             return null;
         }
 
+        builder.binaryOutput(cmd.hasOption("bin"));
+
         // Max simulation time
         if (cmd.hasOption("t")) {
 
@@ -293,6 +331,49 @@ public class ArgParser {
             return null;
         }
 
+        // Tracked particles, after the obstacle since it is the default
+        if (cmd.hasOption("tr")) {
+
+            List<Integer> trackedIds = new ArrayList<>();
+            int particleCount = Integer.parseInt(cmd.getOptionValue("N"));
+            boolean isObstacleFree = cmd.getOptionValue("obs").equals("free");
+
+            if (cmd.getOptionValue("tr") == null) {
+
+                if (!isObstacleFree) {
+                    System.err.println("Tracked particle ids are required with a fixed obstacle");
+                    return null;
+                }
+
+                // The free obstacle goes after the particles
+                trackedIds.add(particleCount);
+
+            } else {
+
+                int lastId = isObstacleFree ? particleCount : particleCount - 1;
+
+                for (String value : cmd.getOptionValue("tr").split(",")) {
+                    int id;
+
+                    try {
+                        id = Integer.parseInt(value.trim());
+                    } catch (NumberFormatException e) {
+                        System.err.println("Invalid tracked particle id: " + value);
+                        return null;
+                    }
+
+                    if (id < 0 || id > lastId) {
+                        System.err.println("Tracked particle id out of range: " + id);
+                        return null;
+                    }
+
+                    trackedIds.add(id);
+                }
+            }
+
+            builder.trackedParticleIds(trackedIds);
+        }
+
         return builder.build();
     }
 
@@ -0,0 +1,144 @@
+package ar.edu.itba.ss.g2.config;
+
+import org.apache.commons.cli.*;
+
+import java.io.IOException;
+import java.nio.file.Files;
+import java.nio.file.Path;
+import java.util.ArrayList;
+import java.util.Comparator;
+import java.util.HashSet;
+import java.util.List;
+import java.util.Set;
+
+public class BatchArgParser {
+
+    private static final List<Option> OPTIONS =
+            List.of(
+                    new Option("h", "help", false, "Print this message"),
+                    new Option(
+                            "batch",
+                            "batch",
+                            true,
+                            "Manifest with the options of one simulation per line"),
+                    new Option("th", "threads", true, "Simulations run at the same time"));
+
+    private final String[] args;
+    private final Options options;
+
+    public BatchArgParser(String[] args) {
+        this.args = args;
+
+        Options options = new Options();
+        OPTIONS.forEach(options::addOption);
+        this.options = options;
+    }
+
+    public static boolean isBatch(String[] args) {
+        return args.length > 0 && (args[0].equals("-batch") || args[0].equals("--batch"));
+    }
+
+    public BatchConfiguration parse() {
+
+        CommandLineParser parser = new DefaultParser();
+
+        CommandLine cmd;
+
+        try {
+            cmd = parser.parse(options, args);
+        } catch (ParseException e) {
+            System.err.println("Error parsing arguments: " + e.getMessage());
+            return null;
+        }
+
+        if (cmd.hasOption("h") || !cmd.hasOption("batch")) {
+            return null;
+        }
+
+        // Threads, one per available processor by default
+        int threadCount = Runtime.getRuntime().availableProcessors();
+
+        if (cmd.hasOption("th")) {
+
+            try {
+                threadCount = Integer.parseInt(cmd.getOptionValue("th"));
+            } catch (NumberFormatException e) {
+                System.err.println("Invalid thread count: " + cmd.getOptionValue("th"));
+                return null;
+            }
+
+            if (threadCount <= 0) {
+                System.err.println("Thread count must be greater than 0");
+                return null;
+            }
+        }
+
+        // Manifest, blank lines and lines starting with # are skipped
+        List<String> lines;
+
+        try {
+            lines = Files.readAllLines(Path.of(cmd.getOptionValue("batch")));
+        } catch (IOException e) {
+            System.err.println("Error reading manifest: " + e.getMessage());
+            return null;
+        }
+
+        List<Configuration> configurations = new ArrayList<>();
+        Set<String> outputDirectories = new HashSet<>();
+
+        for (int i = 0; i < lines.size(); i++) {
+            String line = lines.get(i).trim();
+
+            if (line.isEmpty() || line.startsWith("#")) {
+                continue;
+            }
+
+            Configuration configuration = new ArgParser(line.split("\\s+")).parse();
+
+            if (configuration == null) {
+                System.err.println("Invalid simulation on manifest line " + (i + 1));
+                return null;
+            }
+
+            // Streams of concurrent runs would interleave on stdout
+            if (configuration.isStreamOutput()) {
+                System.err.println("Stream output is not supported on manifest line " + (i + 1));
+                return null;
+            }
+
+            // Runs writing to the same directory would overwrite each other
+            if (!outputDirectories.add(configuration.getOutputDirectory())) {
+                System.err.println(
+                        "Repeated output directory on manifest line "
+                                + (i + 1)
+                                + ": "
+                                + configuration.getOutputDirectory());
+                return null;
+            }
+
+            configurations.add(configuration);
+        }
+
+        if (configurations.isEmpty()) {
+            System.err.println("Manifest has no simulations");
+            return null;
+        }
+
+        return new BatchConfiguration(configurations, threadCount);
+    }
+
+    public void printHelp() {
+
+        HelpFormatter formatter = new HelpFormatter();
+        formatter.setOptionComparator(Comparator.comparingInt(OPTIONS::indexOf));
+
+        formatter.setLeftPadding(4);
+        formatter.setWidth(120);
+
+        String commandLineSyntax =
+                "java -jar event-driven-molecular-dynamics-1.0-SNAPSHOT-jar-with-dependencies.jar"
+                        + " -batch <manifest> [options]";
+
+        formatter.printHelp(commandLineSyntax, options);
+    }
+}
@@ -0,0 +1,6 @@
+package ar.edu.itba.ss.g2.config;
+
+import java.util.List;
+
+// Simulations of a manifest, run in one JVM on a pool of threads
+public record BatchConfiguration(List<Configuration> configurations, int threadCount) {}
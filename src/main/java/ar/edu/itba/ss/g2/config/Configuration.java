@@ -1,5 +1,6 @@
 package ar.edu.itba.ss.g2.config;
 
+import java.util.List;
 import java.util.Random;
 
 public class Configuration {
@@ -26,6 +27,14 @@ public class Configuration {
     private final int skipEvents;
 
     private final String outputDirectory;
+    private final boolean binaryOutput;
+
+    // Particles written to the trajectory file, empty if it is not written
+    private final List<Integer> trackedParticleIds;
+
+    // Events, and snapshots if streamSnapshots, go to stdout instead of the output directory
+    private final boolean streamOutput;
+    private final boolean streamSnapshots;
 
     private Configuration(Builder builder) {
         this.domainSide = builder.domainSide;
@@ -48,6 +57,12 @@ public class Configuration {
         this.skipEvents = builder.skipEvents;
 
         this.outputDirectory = builder.outputDirectory;
+        this.binaryOutput = builder.binaryOutput;
+
+        this.trackedParticleIds = List.copyOf(builder.trackedParticleIds);
+
+        this.streamOutput = builder.streamOutput;
+        this.streamSnapshots = builder.streamSnapshots;
     }
 
     public double getDomainSide() {
@@ -121,6 +136,26 @@ public class Configuration {
         return outputDirectory;
     }
 
+    public boolean isBinaryOutput() {
+        return binaryOutput;
+    }
+
+    public List<Integer> getTrackedParticleIds() {
+        return trackedParticleIds;
+    }
+
+    public boolean isTrajectoryOutput() {
+        return !trackedParticleIds.isEmpty();
+    }
+
+    public boolean isStreamOutput() {
+        return streamOutput;
+    }
+
+    public boolean isStreamSnapshots() {
+        return streamSnapshots;
+    }
+
     @Override
     public String toString() {
         return "Configuration{"
@@ -151,6 +186,14 @@ public class Configuration {
                 + ", outputDirectory='"
                 + outputDirectory
                 + '\''
+                + ", binaryOutput="
+                + binaryOutput
+                + ", trackedParticleIds="
+                + trackedParticleIds
+                + ", streamOutput="
+                + streamOutput
+                + ", streamSnapshots="
+                + streamSnapshots
                 + '}';
     }
 
@@ -178,6 +221,12 @@ public class Configuration {
         private int skipEvents = 1;
 
         private String outputDirectory;
+        private boolean binaryOutput;
+
+        private List<Integer> trackedParticleIds = List.of();
+
+        private boolean streamOutput;
+        private boolean streamSnapshots;
 
         public Builder() {}
 
@@ -246,6 +295,22 @@ public class Configuration {
             return this;
         }
 
+        public Builder binaryOutput(boolean binaryOutput) {
+            this.binaryOutput = binaryOutput;
+            return this;
+        }
+
+        public Builder trackedParticleIds(List<Integer> trackedParticleIds) {
+            this.trackedParticleIds = trackedParticleIds;
+            return this;
+        }
+
+        public Builder streamOutput(boolean streamSnapshots) {
+            this.streamOutput = true;
+            this.streamSnapshots = streamSnapshots;
+            return this;
+        }
+
         public Configuration build() {
             return new Configuration(this);
         }
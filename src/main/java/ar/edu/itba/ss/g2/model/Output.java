@@ -8,4 +8,7 @@ import java.util.Map;
 import java.util.Set;
 
 public record Output(
-        Map<Double, Set<Particle>> snapshots, List<Event> events, Configuration configuration) {}
+        Map<Double, Set<Particle>> snapshots,
+        List<Event> events,
+        List<TrajectoryPoint> trajectory,
+        Configuration configuration) {}
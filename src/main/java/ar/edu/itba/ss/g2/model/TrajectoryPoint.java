@@ -0,0 +1,15 @@
+package ar.edu.itba.ss.g2.model;
+
+// State of a tracked particle right after one of its collisions
+public record TrajectoryPoint(double time, int id, double x, double y, double vx, double vy) {
+
+    public TrajectoryPoint(double time, Particle particle) {
+        this(
+                time,
+                particle.getId(),
+                particle.getX(),
+                particle.getY(),
+                particle.getVx(),
+                particle.getVy());
+    }
+}
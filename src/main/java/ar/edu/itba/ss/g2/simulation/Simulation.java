@@ -1,9 +1,13 @@
 package ar.edu.itba.ss.g2.simulation;
 
 import ar.edu.itba.ss.g2.model.Particle;
+import ar.edu.itba.ss.g2.model.TrajectoryPoint;
 import ar.edu.itba.ss.g2.simulation.events.*;
 
+import java.util.ArrayList;
+import java.util.Collection;
 import java.util.HashMap;
+import java.util.HashSet;
 import java.util.LinkedList;
 import java.util.List;
 import java.util.Map;
@@ -17,6 +21,13 @@ public class Simulation {
     private final Map<Double, Set<Particle>> snapshots;
     private final List<Event> events;
 
+    // Ids whose state is recorded after every one of their collisions
+    private final Set<Integer> trackedIds = new HashSet<>();
+    private final List<TrajectoryPoint> trajectory = new ArrayList<>();
+
+    // Receives the events and snapshots instead of keeping them, if set
+    private SimulationListener listener;
+
     private final Particle[] particles;
     private final PriorityQueue<Event> collisionEventQueue;
 
@@ -84,6 +95,12 @@ public class Simulation {
         // Save initial state
         saveSnapshot(0);
 
+        for (Particle particle : particles) {
+            if (trackedIds.contains(particle.getId())) {
+                trajectory.add(new TrajectoryPoint(0, particle));
+            }
+        }
+
         // Load initial collisions
         for (Particle p1 : particles) {
             addParticleCollisions(p1);
@@ -120,6 +137,10 @@ public class Simulation {
             // Recalculate future collisions
             for (Particle p : event.getParticles()) {
                 addParticleCollisions(p);
+
+                if (trackedIds.contains(p.getId())) {
+                    trajectory.add(new TrajectoryPoint(currentTime, p));
+                }
             }
 
             skipCounter++;
@@ -130,7 +151,12 @@ public class Simulation {
                 saveSnapshot(currentTime);
             }
 
-            events.add(event.copy());
+            // The particles are not moved again before the listener returns, so no copy
+            if (listener != null) {
+                listener.onEvent(event);
+            } else {
+                events.add(event.copy());
+            }
         }
     }
 
@@ -142,6 +168,20 @@ public class Simulation {
         return events;
     }
 
+    // Records the state of these particles at the start and after each of their collisions
+    public void trackParticles(Collection<Integer> ids) {
+        trackedIds.addAll(ids);
+    }
+
+    public List<TrajectoryPoint> getTrajectory() {
+        return trajectory;
+    }
+
+    // Hands every event and snapshot to the listener as it is produced, so they are not kept
+    public void streamTo(SimulationListener listener) {
+        this.listener = listener;
+    }
+
     private Double timeToLinearWallCollision(double v, double radius, double position) {
         if (v == 0) {
             return null;
@@ -274,6 +314,11 @@ public class Simulation {
     }
 
     private void saveSnapshot(double time) {
+        if (listener != null) {
+            listener.onSnapshot(time, particles);
+            return;
+        }
+
         Set<Particle> particlesCopy =
                 Set.of(particles).stream().map(Particle::new).collect(Collectors.toSet());
         snapshots.put(time, particlesCopy);
@@ -0,0 +1,14 @@
+package ar.edu.itba.ss.g2.simulation;
+
+import ar.edu.itba.ss.g2.model.Particle;
+import ar.edu.itba.ss.g2.simulation.events.Event;
+
+// Receives the output of a simulation as it is produced
+public interface SimulationListener {
+
+    // called right after the event is resolved, with its particles in their new state
+    void onEvent(Event event);
+
+    // called with every particle, indexed by id, at each snapshot time
+    void onSnapshot(double time, Particle[] particles);
+}
@@ -38,6 +38,11 @@ public class CircularWallEvent extends OneParticleEvent {
         particle.incrementCollisionCount();
     }
 
+    @Override
+    protected byte getType() {
+        return WALL;
+    }
+
     @Override
     public String toString() {
         Particle particle = getParticles()[0];
@@ -2,7 +2,18 @@ package ar.edu.itba.ss.g2.simulation.events;
 
 import ar.edu.itba.ss.g2.model.Particle;
 
+import java.nio.ByteBuffer;
+
 public abstract class Event implements Comparable<Event> {
+
+    // Event type codes of the binary records
+    public static final byte WALL = 0;
+    public static final byte OBSTACLE = 1;
+    public static final byte PARTICLE = 2;
+
+    // Binary record: time, type, id, other id, x, y, vx1, vy1, x2, y2, vx2, vy2
+    public static final int RECORD_BYTES = Double.BYTES + 1 + 2 * Integer.BYTES + 8 * Double.BYTES;
+
     private final double t;
     private final Particle[] particles;
 
@@ -34,4 +45,7 @@ public abstract class Event implements Comparable<Event> {
     public abstract void resolveCollision();
 
     public abstract Event copy();
+
+    // write the event as a binary record of RECORD_BYTES into the buffer
+    public abstract void writeRecord(ByteBuffer buffer);
 }
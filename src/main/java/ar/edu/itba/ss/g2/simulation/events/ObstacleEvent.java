@@ -47,6 +47,11 @@ public class ObstacleEvent extends OneParticleEvent {
         particle.incrementCollisionCount();
     }
 
+    @Override
+    protected byte getType() {
+        return OBSTACLE;
+    }
+
     @Override
     public String toString() {
         Particle particle = getParticles()[0];
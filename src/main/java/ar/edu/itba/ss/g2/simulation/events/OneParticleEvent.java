@@ -2,6 +2,8 @@ package ar.edu.itba.ss.g2.simulation.events;
 
 import ar.edu.itba.ss.g2.model.Particle;
 
+import java.nio.ByteBuffer;
+
 public abstract class OneParticleEvent extends Event {
     protected final int collisionCount;
 
@@ -18,4 +20,25 @@ public abstract class OneParticleEvent extends Event {
         Particle particle = getParticles()[0];
         return particle.getCollisionCount() != collisionCount;
     }
+
+    // return the type code of the binary record
+    protected abstract byte getType();
+
+    @Override
+    public void writeRecord(ByteBuffer buffer) {
+        Particle particle = getParticles()[0];
+
+        buffer.putDouble(getTime());
+        buffer.put(getType());
+        buffer.putInt(particle.getId());
+        buffer.putInt(-1);
+        buffer.putDouble(particle.getX());
+        buffer.putDouble(particle.getY());
+        buffer.putDouble(particle.getVx());
+        buffer.putDouble(particle.getVy());
+        buffer.putDouble(particle.getX());
+        buffer.putDouble(particle.getY());
+        buffer.putDouble(previousVx);
+        buffer.putDouble(previousVy);
+    }
 }
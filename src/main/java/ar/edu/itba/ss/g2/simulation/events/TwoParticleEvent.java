@@ -2,6 +2,8 @@ package ar.edu.itba.ss.g2.simulation.events;
 
 import ar.edu.itba.ss.g2.model.Particle;
 
+import java.nio.ByteBuffer;
+
 public class TwoParticleEvent extends Event {
     private final int collisionCountA;
     private final int collisionCountB;
@@ -82,4 +84,23 @@ public class TwoParticleEvent extends Event {
 
         return new TwoParticleEvent(getTime(), new Particle(a), new Particle(b));
     }
+
+    @Override
+    public void writeRecord(ByteBuffer buffer) {
+        Particle a = getParticles()[0];
+        Particle b = getParticles()[1];
+
+        buffer.putDouble(getTime());
+        buffer.put(PARTICLE);
+        buffer.putInt(a.getId());
+        buffer.putInt(b.getId());
+        buffer.putDouble(a.getX());
+        buffer.putDouble(a.getY());
+        buffer.putDouble(a.getVx());
+        buffer.putDouble(a.getVy());
+        buffer.putDouble(b.getX());
+        buffer.putDouble(b.getY());
+        buffer.putDouble(b.getVx());
+        buffer.putDouble(b.getVy());
+    }
 }
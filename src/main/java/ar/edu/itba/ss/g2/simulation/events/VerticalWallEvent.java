@@ -19,6 +19,11 @@ public class VerticalWallEvent extends OneParticleEvent {
         particle.incrementCollisionCount();
     }
 
+    @Override
+    protected byte getType() {
+        return WALL;
+    }
+
     @Override
     public String toString() {
         Particle particle = getParticles()[0];
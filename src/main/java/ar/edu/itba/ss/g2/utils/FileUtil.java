@@ -3,17 +3,36 @@ package ar.edu.itba.ss.g2.utils;
 import ar.edu.itba.ss.g2.config.Configuration;
 import ar.edu.itba.ss.g2.model.Output;
 import ar.edu.itba.ss.g2.model.Particle;
+import ar.edu.itba.ss.g2.model.TrajectoryPoint;
 import ar.edu.itba.ss.g2.simulation.events.Event;
 
 import java.io.BufferedWriter;
 import java.io.File;
 import java.io.FileWriter;
 import java.io.IOException;
+import java.nio.ByteBuffer;
+import java.nio.ByteOrder;
+import java.nio.channels.FileChannel;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Path;
+import java.nio.file.StandardOpenOption;
 import java.util.*;
 import java.util.Map.Entry;
 
 public class FileUtil {
 
+    private static final int BUFFER_SIZE = 128 * 1024;
+
+    // Binary files start with an 8 byte magic, the format version, the width of each
+    // element (particles per snapshot or bytes per event) and the element count
+    private static final int BINARY_VERSION = 1;
+    private static final byte[] SNAPSHOTS_MAGIC = "EDMDSNAP".getBytes(StandardCharsets.US_ASCII);
+    private static final byte[] EVENTS_MAGIC = "EDMDEVNT".getBytes(StandardCharsets.US_ASCII);
+    private static final byte[] TRAJECTORY_MAGIC = "EDMDTRAJ".getBytes(StandardCharsets.US_ASCII);
+
+    // Binary trajectory record: time, id, x, y, vx, vy
+    private static final int TRAJECTORY_RECORD_BYTES = Double.BYTES + Integer.BYTES + 4 * Double.BYTES;
+
     private FileUtil() {
         throw new RuntimeException("Util class");
     }
@@ -28,11 +47,12 @@ public class FileUtil {
 
         // Static
         Configuration configuration = output.configuration();
+        int particleCount = configuration.getParticleCount();
+        if (configuration.isObstacleFree()) {
+            particleCount += 1;
+        }
+
         try (FileWriter writer = new FileWriter(directory + "/static.txt")) {
-            int particleCount = configuration.getParticleCount();
-            if (configuration.isObstacleFree()) {
-                particleCount += 1;
-            }
             writer.write(particleCount + "\n");
             writer.write(configuration.getParticleRadius() + "\n");
             writer.write(configuration.getParticleMass() + "\n");
@@ -59,18 +79,35 @@ public class FileUtil {
         }
 
         // dynamic
-        Map<Double, Set<Particle>> snapshots = output.snapshots();
-        try (BufferedWriter writer = new BufferedWriter(new FileWriter(directory + "/snapshots.txt"), 128 * 1024)) {
-            List<Entry<Double, Set<Particle>>> entries = new ArrayList<>(snapshots.entrySet());
-            entries.sort(Comparator.comparingDouble(Entry::getKey));
+        List<Entry<Double, Set<Particle>>> entries = new ArrayList<>(output.snapshots().entrySet());
+        entries.sort(Comparator.comparingDouble(Entry::getKey));
+
+        List<Event> events = output.events();
+
+        if (configuration.isBinaryOutput()) {
+            serializeSnapshotsBinary(entries, particleCount, directory + "/snapshots.bin");
+            serializeEventsBinary(events, directory + "/events.bin");
+        } else {
+            serializeSnapshots(entries, directory + "/snapshots.txt");
+            serializeEvents(events, directory + "/events.txt");
+        }
+
+        if (configuration.isTrajectoryOutput()) {
+            if (configuration.isBinaryOutput()) {
+                serializeTrajectoryBinary(output.trajectory(), directory + "/trajectory.bin");
+            } else {
+                serializeTrajectory(output.trajectory(), directory + "/trajectory.txt");
+            }
+        }
+    }
 
+    private static void serializeSnapshots(List<Entry<Double, Set<Particle>>> entries, String file)
+            throws IOException {
+        try (BufferedWriter writer = new BufferedWriter(new FileWriter(file), BUFFER_SIZE)) {
             for (Entry<Double, Set<Particle>> entry : entries) {
                 writer.write(entry.getKey() + "\n");
 
-                List<Particle> particles = new ArrayList<>(entry.getValue());
-                particles.sort(Comparator.comparingInt(Particle::getId));
-
-                for (Particle particle : particles) {
+                for (Particle particle : sortedById(entry.getValue())) {
                     writer.write(
                             String.format(
                                 "%.5f %.5f %.5f %.5f\n", 
@@ -82,12 +119,131 @@ public class FileUtil {
                 }
             }
         }
+    }
 
-        List<Event> events = output.events();
-        try (BufferedWriter writer = new BufferedWriter(new FileWriter(directory + "/events.txt"), 128 * 1024)) {
+    private static void serializeEvents(List<Event> events, String file) throws IOException {
+        try (BufferedWriter writer = new BufferedWriter(new FileWriter(file), BUFFER_SIZE)) {
             for (Event event : events) {
                 writer.write(event + "\n");
             }
         }
     }
+
+    // One line per tracked particle state: time id x y vx vy
+    private static void serializeTrajectory(List<TrajectoryPoint> trajectory, String file)
+            throws IOException {
+        try (BufferedWriter writer = new BufferedWriter(new FileWriter(file), BUFFER_SIZE)) {
+            for (TrajectoryPoint point : trajectory) {
+                writer.write(
+                        point.time()
+                                + " "
+                                + point.id()
+                                + String.format(
+                                        " %.7f %.7f %.7f %.7f\n",
+                                        point.x(),
+                                        point.y(),
+                                        point.vx(),
+                                        point.vy()));
+            }
+        }
+    }
+
+    // Header, then every snapshot time, then the x, y, vx, vy of every particle of every snapshot
+    private static void serializeSnapshotsBinary(
+            List<Entry<Double, Set<Particle>>> entries, int particleCount, String file)
+            throws IOException {
+        try (FileChannel channel = openBinary(file)) {
+            ByteBuffer buffer = ByteBuffer.allocate(BUFFER_SIZE).order(ByteOrder.LITTLE_ENDIAN);
+            writeHeader(buffer, SNAPSHOTS_MAGIC, particleCount, entries.size());
+
+            for (Entry<Double, Set<Particle>> entry : entries) {
+                ensureRemaining(channel, buffer, Double.BYTES);
+                buffer.putDouble(entry.getKey());
+            }
+
+            for (Entry<Double, Set<Particle>> entry : entries) {
+                for (Particle particle : sortedById(entry.getValue())) {
+                    ensureRemaining(channel, buffer, 4 * Double.BYTES);
+                    buffer.putDouble(particle.getX());
+                    buffer.putDouble(particle.getY());
+                    buffer.putDouble(particle.getVx());
+                    buffer.putDouble(particle.getVy());
+                }
+            }
+
+            flush(channel, buffer);
+        }
+    }
+
+    // Header, then one fixed width record per event (see Event.writeRecord)
+    private static void serializeEventsBinary(List<Event> events, String file) throws IOException {
+        try (FileChannel channel = openBinary(file)) {
+            ByteBuffer buffer = ByteBuffer.allocate(BUFFER_SIZE).order(ByteOrder.LITTLE_ENDIAN);
+            writeHeader(buffer, EVENTS_MAGIC, Event.RECORD_BYTES, events.size());
+
+            for (Event event : events) {
+                ensureRemaining(channel, buffer, Event.RECORD_BYTES);
+                event.writeRecord(buffer);
+            }
+
+            flush(channel, buffer);
+        }
+    }
+
+    // Header, then one time, id, x, y, vx, vy record per tracked particle state
+    private static void serializeTrajectoryBinary(List<TrajectoryPoint> trajectory, String file)
+            throws IOException {
+        try (FileChannel channel = openBinary(file)) {
+            ByteBuffer buffer = ByteBuffer.allocate(BUFFER_SIZE).order(ByteOrder.LITTLE_ENDIAN);
+            writeHeader(buffer, TRAJECTORY_MAGIC, TRAJECTORY_RECORD_BYTES, trajectory.size());
+
+            for (TrajectoryPoint point : trajectory) {
+                ensureRemaining(channel, buffer, TRAJECTORY_RECORD_BYTES);
+                buffer.putDouble(point.time());
+                buffer.putInt(point.id());
+                buffer.putDouble(point.x());
+                buffer.putDouble(point.y());
+                buffer.putDouble(point.vx());
+                buffer.putDouble(point.vy());
+            }
+
+            flush(channel, buffer);
+        }
+    }
+
+    private static List<Particle> sortedById(Set<Particle> particles) {
+        List<Particle> sorted = new ArrayList<>(particles);
+        sorted.sort(Comparator.comparingInt(Particle::getId));
+        return sorted;
+    }
+
+    private static FileChannel openBinary(String file) throws IOException {
+        return FileChannel.open(
+                Path.of(file),
+                StandardOpenOption.CREATE,
+                StandardOpenOption.WRITE,
+                StandardOpenOption.TRUNCATE_EXISTING);
+    }
+
+    private static void writeHeader(ByteBuffer buffer, byte[] magic, int width, long count) {
+        buffer.put(magic);
+        buffer.putInt(BINARY_VERSION);
+        buffer.putInt(width);
+        buffer.putLong(count);
+    }
+
+    private static void ensureRemaining(FileChannel channel, ByteBuffer buffer, int bytes)
+            throws IOException {
+        if (buffer.remaining() < bytes) {
+            flush(channel, buffer);
+        }
+    }
+
+    private static void flush(FileChannel channel, ByteBuffer buffer) throws IOException {
+        buffer.flip();
+        while (buffer.hasRemaining()) {
+            channel.write(buffer);
+        }
+        buffer.clear();
+    }
 }
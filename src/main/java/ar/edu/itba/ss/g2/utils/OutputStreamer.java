@@ -0,0 +1,72 @@
+package ar.edu.itba.ss.g2.utils;
+
+import ar.edu.itba.ss.g2.model.Particle;
+import ar.edu.itba.ss.g2.simulation.SimulationListener;
+import ar.edu.itba.ss.g2.simulation.events.Event;
+
+import java.io.BufferedWriter;
+import java.io.Closeable;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.OutputStreamWriter;
+import java.io.UncheckedIOException;
+import java.io.Writer;
+import java.nio.charset.StandardCharsets;
+
+// Writes the output of a simulation to stdout as it is produced. Events use the
+// events.txt lines, snapshots an "S <time>" line followed by the snapshots.txt rows.
+public class OutputStreamer implements SimulationListener, Closeable {
+
+    private static final int BUFFER_SIZE = 128 * 1024;
+
+    private final Writer writer;
+    private final boolean streamSnapshots;
+
+    public OutputStreamer(boolean streamSnapshots) {
+        this.writer =
+                new BufferedWriter(
+                        new OutputStreamWriter(
+                                new FileOutputStream(FileDescriptor.out), StandardCharsets.US_ASCII),
+                        BUFFER_SIZE);
+        this.streamSnapshots = streamSnapshots;
+    }
+
+    @Override
+    public void onEvent(Event event) {
+        write(event + "\n");
+    }
+
+    @Override
+    public void onSnapshot(double time, Particle[] particles) {
+        if (!streamSnapshots) {
+            return;
+        }
+
+        write("S " + time + "\n");
+
+        for (Particle particle : particles) {
+            write(
+                    String.format(
+                            "%.5f %.5f %.5f %.5f\n",
+                            particle.getX(),
+                            particle.getY(),
+                            particle.getVx(),
+                            particle.getVy()));
+        }
+    }
+
+    @Override
+    public void close() throws IOException {
+        writer.flush();
+    }
+
+    // The listener can not throw checked exceptions, a closed pipe ends the simulation
+    private void write(String line) {
+        try {
+            writer.write(line);
+        } catch (IOException e) {
+            throw new UncheckedIOException(e);
+        }
+    }
+}